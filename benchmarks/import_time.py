@@ -0,0 +1,100 @@
+"""Import time budget check.
+
+Imports the core modules in a fresh interpreter with `python -X importtime` and
+fails when the cumulative import time of a module exceeds its budget. discord.py
+is imported first, so its own cost is not charged to the modules using it.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget src.core._events=10 --runs 10
+
+The best of `--runs` runs is kept, to smooth out the noise of a busy machine.
+"""
+import argparse
+import compileall
+from pathlib import Path
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+PRELOADED = ['discord', 'discord.ext.commands']
+
+# Cumulative import time budgets, in milliseconds
+BUDGETS: Dict[str, float] = {
+    'src.core.client': 30.0,
+    'src.core._cog_loader': 5.0,
+    'src.core._events': 5.0,
+    'src.core._help_command': 5.0,
+    'src.core.commands.core': 8.0,
+    'src.core.commands.dev': 5.0,
+    'src.core.commands.owner': 8.0,
+    'src.utils.logger': 2.0,
+    'src.utils.profiler': 5.0,
+    'src.utils.storage': 20.0,
+    'src.utils.times': 15.0,
+}
+
+IMPORT_TIME_RE = re.compile(r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \|(?P<indent>\s*)(?P<module>\S+)$')
+
+def measure(modules: List[str]) -> Dict[str, float]:
+    """Cumulative import time of every module imported, in milliseconds"""
+    code = '; '.join(f'import {module}' for module in PRELOADED + modules)
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{process.stderr}")
+
+    timings: Dict[str, float] = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if match:
+            timings[match['module']] = int(match['cumulative']) / 1000
+    return timings
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check the import time of the core modules.")
+    parser.add_argument('--runs', type=int, default=5, help="Number of runs, the best one is kept")
+    parser.add_argument(
+        '--budget', action='append', default=[], metavar='MODULE=MS',
+        help="Override or add a budget, can be repeated"
+    )
+    args = parser.parse_args()
+
+    budgets = dict(BUDGETS)
+    for budget in args.budget:
+        module, _, milliseconds = budget.partition('=')
+        budgets[module] = float(milliseconds)
+
+    # Bytecode compilation is not part of a normal start
+    compileall.compile_dir(PROJECT_ROOT / 'src', quiet=1)
+
+    best: Dict[str, float] = {}
+    for _ in range(args.runs):
+        for module, milliseconds in measure(list(budgets)).items():
+            best[module] = min(milliseconds, best.get(module, milliseconds))
+
+    failures = []
+    for module, budget in sorted(budgets.items()):
+        milliseconds = best.get(module)
+        if milliseconds is None:
+            print(f"{module:<32} already imported by a preloaded module")
+            continue
+
+        status = 'ok' if milliseconds <= budget else 'OVER BUDGET'
+        print(f"{module:<32} {milliseconds:8.2f} ms / {budget:6.1f} ms  {status}")
+        if milliseconds > budget:
+            failures.append(module)
+
+    if failures:
+        print(f"{len(failures)} module(s) over budget: {', '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
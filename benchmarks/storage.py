@@ -0,0 +1,241 @@
+"""Storage layer benchmarks.
+
+Runs offline against a temporary data directory and prints the results as JSON.
+Every metric is a duration in seconds or a size in bytes, so lower is better.
+
+    python -m benchmarks.storage --output results.json
+    python -m benchmarks.storage --baseline benchmarks/storage_baseline.json
+    python -m benchmarks.storage --save-baseline benchmarks/storage_baseline.json
+
+Every measurement is repeated `--repeat` times and the best one is kept, the
+cold load is timed without tracemalloc, which only measures the memory footprint.
+The `json-keys` backend times key-level reads and writes on a `JSONStorage` of
+plain keys, the other backends guild-level ones on a guild storage.
+
+With a baseline, metrics slower than the baseline by more than `--threshold`
+are reported and the exit code is 1.
+"""
+import argparse
+import asyncio
+import json
+from pathlib import Path
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List
+
+from src.utils.sqlite_storage import SQLiteGuildStorage
+from src.utils.storage import GuildStorage, JournalGuildStorage, JSONStorage
+
+BACKENDS: Dict[str, Callable[..., Any]] = {
+    'json': lambda name, storage_dir: GuildStorage(name, storage_dir=storage_dir),
+    'json-write-behind': lambda name, storage_dir: GuildStorage(
+        name, storage_dir=storage_dir, write_behind=True, flush_interval=0.5
+    ),
+    'journal': lambda name, storage_dir: JournalGuildStorage(name, storage_dir=storage_dir),
+    'sqlite': lambda name, storage_dir: SQLiteGuildStorage(name, storage_dir=storage_dir),
+}
+
+KEY_BACKENDS: Dict[str, Callable[..., Any]] = {
+    'json-keys': lambda name, storage_dir: JSONStorage(name, storage_dir=storage_dir),
+}
+
+def _guild_data(guild_id: int) -> Dict[str, Any]:
+    return {
+        'prefix': '!',
+        'welcome_channel': guild_id * 7,
+        'roles': [guild_id, guild_id + 1, guild_id + 2],
+        'balances': {str(member): member * 10 for member in range(5)},
+    }
+
+async def _populate(storage: Any, size: int) -> None:
+    if isinstance(storage, SQLiteGuildStorage):
+        for guild_id in range(size):
+            await storage.update_guild_data(guild_id, _guild_data(guild_id))
+        return
+
+    async with storage.transaction():
+        for guild_id in range(size):
+            await storage.update_guild_data(guild_id, _guild_data(guild_id))
+
+async def _best_of(measure: Callable[[], Awaitable[float]], repeat: int) -> float:
+    """Shortest duration of several runs of a measure, the others were slowed down by the machine"""
+    return min([await measure() for _ in range(repeat)])
+
+async def _timed_operations(
+    operation: Callable[[int], Any],
+    budget: float,
+    max_operations: int,
+    repeat: int
+) -> float:
+    """Average duration of an operation in the fastest of `repeat` rounds, sharing the time budget"""
+    async def timed_round() -> float:
+        operations = 0
+        start = time.perf_counter()
+        while operations < max_operations and (operations == 0 or time.perf_counter() - start < budget / repeat):
+            await operation(operations)
+            operations += 1
+        return (time.perf_counter() - start) / operations
+
+    return await _best_of(timed_round, repeat)
+
+async def _cold_load(factory: Callable[..., Any], name: str, storage_dir: Path, repeat: int) -> Dict[str, float]:
+    """Load duration, without tracemalloc slowing it down, then memory footprint in a separate pass"""
+    async def load() -> float:
+        start = time.perf_counter()
+        storage = factory(name, storage_dir)
+        duration = time.perf_counter() - start
+        await storage.close()
+        return duration
+
+    results = {'cold_load_s': await _best_of(load, repeat)}
+
+    tracemalloc.start()
+    storage = factory(name, storage_dir)
+    results['memory_bytes'] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    await storage.close()
+    return results
+
+async def bench_backend(backend: str, size: int, storage_dir: Path, budget: float, repeat: int) -> Dict[str, float]:
+    factory = BACKENDS[backend]
+    name = f'bench_{backend.replace("-", "_")}_{size}'
+
+    storage = factory(name, storage_dir)
+    await _populate(storage, size)
+    await storage.close()
+
+    results = await _cold_load(factory, name, storage_dir, repeat)
+    storage = factory(name, storage_dir)
+
+    guild_ids = [random.randrange(size) for _ in range(1000)]
+
+    async def get(index: int) -> None:
+        await storage.get_guild_data(guild_ids[index % len(guild_ids)])
+
+    async def set_(index: int) -> None:
+        await storage.set_guild_data(guild_ids[index % len(guild_ids)], 'prefix', str(index))
+
+    results['get_latency_s'] = await _timed_operations(get, budget, 10000, repeat)
+    results['set_latency_s'] = await _timed_operations(set_, budget, 10000, repeat)
+
+    # Concurrent writers on distinct guilds
+    writers, writes_per_writer = 10, 20
+    async def writer(offset: int) -> None:
+        for index in range(writes_per_writer):
+            await storage.set_guild_data((offset * writes_per_writer + index) % size, 'prefix', '?')
+
+    async def concurrent_set() -> float:
+        start = time.perf_counter()
+        await asyncio.gather(*(writer(offset) for offset in range(writers)))
+        return (time.perf_counter() - start) / (writers * writes_per_writer)
+
+    results['concurrent_set_latency_s'] = await _best_of(concurrent_set, repeat)
+
+    # Backup cost
+    if isinstance(storage, GuildStorage):
+        async def backup() -> float:
+            start = time.perf_counter()
+            await storage.backups.write_snapshot(dict(storage._data))
+            return time.perf_counter() - start
+
+        results['backup_s'] = await _best_of(backup, repeat)
+
+    await storage.close()
+    return results
+
+async def bench_keys(backend: str, size: int, storage_dir: Path, budget: float, repeat: int) -> Dict[str, float]:
+    """Key-level reads and writes on a storage of `size` plain keys"""
+    factory = KEY_BACKENDS[backend]
+    name = f'bench_{backend.replace("-", "_")}_{size}'
+
+    storage = factory(name, storage_dir)
+    async with storage.transaction():
+        for index in range(size):
+            await storage.set(f'key_{index}', index)
+    await storage.close()
+
+    results = await _cold_load(factory, name, storage_dir, repeat)
+    storage = factory(name, storage_dir)
+
+    keys = [f'key_{random.randrange(size)}' for _ in range(1000)]
+
+    async def get(index: int) -> None:
+        await storage.get(keys[index % len(keys)])
+
+    async def set_(index: int) -> None:
+        await storage.set(keys[index % len(keys)], index)
+
+    results['get_latency_s'] = await _timed_operations(get, budget, 10000, repeat)
+    results['set_latency_s'] = await _timed_operations(set_, budget, 10000, repeat)
+
+    await storage.close()
+    return results
+
+async def run(sizes: List[int], backends: List[str], budget: float, repeat: int) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory(prefix='powipy-bench-') as tmp_dir:
+        for backend in backends:
+            bench = bench_keys if backend in KEY_BACKENDS else bench_backend
+            for size in sizes:
+                backend_results = await bench(backend, size, Path(tmp_dir), budget, repeat)
+                for metric, value in backend_results.items():
+                    results[f'{backend}/{size}/{metric}'] = value
+                print(f"{backend} {size}: done", file=sys.stderr)
+    return results
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """Metrics regressing by more than `threshold` compared to the baseline"""
+    regressions = []
+    for metric, value in sorted(results.items()):
+        reference = baseline.get(metric)
+        if not reference:
+            continue
+        ratio = value / reference
+        if ratio > 1 + threshold:
+            regressions.append(f"{metric}: {value:.6g} vs {reference:.6g} (x{ratio:.2f})")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the storage layer.")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="Comma separated numbers of guilds")
+    parser.add_argument('--backends', default=','.join([*BACKENDS, *KEY_BACKENDS]), help="Comma separated backends")
+    parser.add_argument('--budget', type=float, default=1.0, help="Seconds spent per latency measure")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs of every measurement, the best one is kept")
+    parser.add_argument('--output', type=Path, help="Write the results to this JSON file")
+    parser.add_argument('--baseline', type=Path, help="Compare the results to this JSON file")
+    parser.add_argument('--save-baseline', type=Path, help="Write the results as a new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown ratio, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    backends = args.backends.split(',')
+    results = asyncio.run(run(sizes, backends, args.budget, args.repeat))
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output)
+    if args.save_baseline:
+        args.save_baseline.write_text(output)
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions:", *regressions, sep='\n', file=sys.stderr)
+            return 1
+        print("No regression.", file=sys.stderr)
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
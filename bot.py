@@ -1,13 +1,27 @@
+import time
+start = time.perf_counter()
+
+import argparse
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
 from src import Client
+from src.utils.profiler import profiler
 
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile-startup', action='store_true', help="Time the startup and write a JSON trace")
+    parser.add_argument('--profile-output', help="Path of the startup trace, logs/startup_trace.json by default")
+    args = parser.parse_args()
+
+    if args.profile_startup or os.getenv('PROFILE_STARTUP') == '1':
+        profiler.enable(origin=start, trace_path=args.profile_output)
+        profiler.record('imports', start, time.perf_counter(), 'phase')
+
     token = os.getenv('TOKEN')
-    bot = Client(command_prefix="!")
+    bot = Client(command_prefix="!", lazy_cogs=os.getenv('LAZY_COGS') == '1')
     bot.run(token, log_handler=None)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
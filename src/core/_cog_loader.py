@@ -1,8 +1,12 @@
-import importlib
+import ast
+import asyncio
+import hashlib
 import importlib.util
+import json
 import logging
 import os
-from typing import List
+import time
+from typing import Any, Dict, List, Optional
 
 from discord.ext import commands
 from src.utils.logger import init_logging
@@ -11,21 +15,33 @@ class CogLoadError(Exception):
     pass
 
 class CogLoader:
+    """Load the cogs packages concurrently
+
+    A cog package can declare the cogs it needs loaded first with a module level
+    `requires = ['other_cog']` list in its `__init__.py`.
+    """
     __cogs_dir = os.path.join(os.path.dirname(__file__), '../cogs')
     base_cog_import_path = 'src.cogs.'
 
     __core_commands_dir = os.path.join(os.path.dirname(__file__), './commands')
     core_cog_import_path = 'src.core.commands.'
 
+    manifest_path = os.path.join(__cogs_dir, 'manifest.json')
+
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.__lazy_locks: Dict[str, asyncio.Lock] = {}
+        # Duration of the last load or reload of each cog, in seconds
+        self.timings: Dict[str, float] = {}
+        # Why each cog was left out of its last load or reload
+        self.skipped: Dict[str, str] = {}
         init_logging('CogLoader', log_level=logging.INFO, file_log_level=logging.WARNING)
         self.logger = logging.getLogger('CogLoader')
 
     def __check_directory(self):
         if not os.path.exists(self.__cogs_dir):
             raise CogLoadError(f"Cogs directory not found: {self.__cogs_dir}")
-        
+
     def get_potential_packages(self, core: bool = False) -> List[str]:
         cogs_dir = self.__cogs_dir if not core else self.__core_commands_dir
 
@@ -39,56 +55,346 @@ class CogLoader:
         except Exception as e:
             raise CogLoadError(f"Error reading cogs directory: {str(e)}")
 
-    async def __verify_cog_structure(self, cog_path: str, core: bool) -> bool:
+    def get_directory_mtime(self) -> Optional[int]:
+        """Modification time of the cogs directory, changed when a cog package is added or removed"""
+        try:
+            return os.stat(self.__cogs_dir).st_mtime_ns
+        except OSError:
+            return None
+
+    def fingerprint(self, cog_package: str, core: bool = False) -> Optional[str]:
+        """Fingerprint of the source files of a cog package, from their mtime and size"""
+        cog_path = os.path.join(self.__cogs_dir if not core else self.__core_commands_dir, cog_package)
+        digest = hashlib.sha1()
+
+        try:
+            for root, directories, files in os.walk(cog_path):
+                directories[:] = sorted(directory for directory in directories if directory != '__pycache__')
+                for filename in sorted(files):
+                    if not filename.endswith('.py'):
+                        continue
+                    file_path = os.path.join(root, filename)
+                    stat = os.stat(file_path)
+                    digest.update(f"{os.path.relpath(file_path, cog_path)}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+        except OSError:
+            return None
+
+        return digest.hexdigest()
+
+    def __read_cog_package(self, cog_path: str, core: bool) -> Optional[List[str]]:
+        """
+        Verify a cog package without importing it, and return its requirements.
+        Returns None if the package is invalid.
+        """
         cog_import_path = self.base_cog_import_path if not core else self.core_cog_import_path
 
         try:
             init_path = os.path.join(cog_path, '__init__.py')
             if not os.path.exists(init_path):
                 self.logger.warning(f"Missing __init__.py in {cog_path}")
-                return False
-            
+                return None
+
             package_name = os.path.basename(cog_path)
+            if importlib.util.find_spec(f"{cog_import_path}{package_name}") is None:
+                self.logger.warning(f"Could not find cog package {package_name}")
+                return None
 
-            try:
-                module = importlib.import_module(f"{cog_import_path}{package_name}")
+            with open(init_path, 'r', encoding='utf-8') as file:
+                tree = ast.parse(file.read(), filename=init_path)
+
+            has_setup = False
+            requires: List[str] = []
+            for node in tree.body:
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == 'setup':
+                    has_setup = True
+                elif isinstance(node, ast.ImportFrom) and any(
+                    (alias.asname or alias.name) == 'setup' for alias in node.names
+                ):
+                    has_setup = True
+                elif isinstance(node, ast.Assign) and any(
+                    isinstance(target, ast.Name) and target.id == 'requires' for target in node.targets
+                ):
+                    requires = list(ast.literal_eval(node.value))
+
+            if not has_setup:
+                self.logger.warning(f"No setup function found in {cog_path}")
+                return None
+
+            return requires
 
-                if not hasattr(module, 'setup'):
-                    self.logger.warning(f"No setup function found in {cog_path}")
-                    return False
-                
-                return True
-            
-            except ImportError as e:
-                self.logger.warning(f"Could not import cog package {package_name}: {str(e)}")
-                return False
-        
         except Exception as e:
             self.logger.warning(f"Error verifying cog structure for {cog_path}: {str(e)}")
-            return False
+            return None
 
-    async def __load_cog(self, cog_package: str, core: bool = False):
-        cog_path = os.path.join(self.__cogs_dir if not core else self.__core_commands_dir, cog_package)
+    def __sort_cogs(self, requirements: Dict[str, List[str]]) -> List[str]:
+        """
+        Topologically sort the cogs by their requirements.
+        Cogs in a cycle are reported and left out.
+        """
+        remaining = {cog: set(requires) & set(requirements) for cog, requires in requirements.items()}
+        ordered: List[str] = []
+
+        while remaining:
+            ready = sorted(cog for cog, requires in remaining.items() if not requires)
+            if not ready:
+                self.logger.error(
+                    f"Cog dependency cycle detected, not loading: {', '.join(sorted(remaining))}"
+                )
+                break
+
+            for cog in ready:
+                del remaining[cog]
+                ordered.append(cog)
+            for requires in remaining.values():
+                requires.difference_update(ready)
+
+        return ordered
+
+    async def __load_cog(self, cog_package: str, core: bool = False, reload: bool = False) -> bool:
         cog_import_path = f'{self.base_cog_import_path if not core else self.core_cog_import_path}{cog_package}'
 
+        start = time.perf_counter()
         try:
-            if not await self.__verify_cog_structure(cog_path, core):
-                self.logger.warning(f"Skipping {cog_package} due to invalid structure")
-                return
+            if reload:
+                await self.bot.reload_extension(cog_import_path)
+            else:
+                await self.bot.load_extension(cog_import_path)
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Failed to {'reload' if reload else 'load'} cog {cog_package}: {str(e)}", exc_info=True)
+            return False
+
+        finally:
+            self.timings[cog_package] = time.perf_counter() - start
+
+    def __read_commands(self, cog_path: str) -> Dict[str, Any]:
+        """
+        Read the prefix commands declared by a cog package without importing it.
+        A cog with listeners, app commands or hybrid commands can't be loaded lazily.
+        """
+        entries: List[Dict[str, Any]] = []
+        lazy = True
+
+        for root, _, files in os.walk(cog_path):
+            for filename in sorted(files):
+                if not filename.endswith('.py'):
+                    continue
+
+                file_path = os.path.join(root, filename)
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    tree = ast.parse(file.read(), filename=file_path)
+
+                for node in ast.walk(tree):
+                    if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        continue
+
+                    for decorator in node.decorator_list:
+                        call = decorator if isinstance(decorator, ast.Call) else None
+                        function = call.func if call else decorator
+                        if not isinstance(function, ast.Attribute):
+                            continue
+
+                        if function.attr in ('listener', 'hybrid_command', 'hybrid_group') or (
+                            isinstance(function.value, ast.Name) and function.value.id == 'app_commands'
+                        ):
+                            lazy = False
+                            continue
+
+                        # Only top level commands, `@group.command` are subcommands
+                        if function.attr not in ('command', 'group') or not (
+                            isinstance(function.value, ast.Name) and function.value.id == 'commands'
+                        ):
+                            continue
+
+                        kwargs = {
+                            keyword.arg: ast.literal_eval(keyword.value)
+                            for keyword in (call.keywords if call else [])
+                            if keyword.arg in ('name', 'aliases', 'help')
+                        }
+                        if call and call.args:
+                            kwargs.setdefault('name', ast.literal_eval(call.args[0]))
 
-            await self.bot.load_extension(cog_import_path)
+                        entries.append({
+                            'name': kwargs.get('name') or node.name,
+                            'aliases': list(kwargs.get('aliases', [])),
+                            'help': kwargs.get('help') or ast.get_docstring(node),
+                        })
 
+        return {'lazy': lazy and bool(entries), 'commands': entries}
+
+    def build_manifest(self) -> Dict[str, Any]:
+        """Build the manifest of the commands and requirements of every valid cog"""
+        self.__check_directory()
+
+        manifest: Dict[str, Any] = {}
+        for cog_package in sorted(self.get_potential_packages()):
+            cog_path = os.path.join(self.__cogs_dir, cog_package)
+            requires = self.__read_cog_package(cog_path, core=False)
+            if requires is None:
+                continue
+
+            try:
+                manifest[cog_package] = {'requires': requires, **self.__read_commands(cog_path)}
+            except Exception as e:
+                self.logger.warning(f"Error reading commands for {cog_path}: {str(e)}")
+
+        return manifest
+
+    def write_manifest(self) -> Dict[str, Any]:
+        manifest = self.build_manifest()
+        with open(self.manifest_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=2, ensure_ascii=False)
+        return manifest
+
+    def read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            self.logger.warning(f"Cogs manifest not found: {self.manifest_path}, loading every cog")
         except Exception as e:
-            self.logger.error(f"Failed to load cog {cog_package}: {str(e)}", exc_info=True)
+            self.logger.warning(f"Error reading cogs manifest, loading every cog: {str(e)}")
+        return {}
+
+    async def __load_lazy_cog(self, cog_package: str, manifest: Dict[str, Any]):
+        """Load a lazy cog and its requirements, once"""
+        lock = self.__lazy_locks.setdefault(cog_package, asyncio.Lock())
+        async with lock:
+            if f'{self.base_cog_import_path}{cog_package}' in self.bot.extensions:
+                return
+
+            for required in manifest[cog_package]['requires']:
+                if required in manifest:
+                    await self.__load_lazy_cog(required, manifest)
+
+            self.logger.info(f"Loading {cog_package} on first use")
+            await self.bot.load_extension(f'{self.base_cog_import_path}{cog_package}')
+
+    def __register_placeholders(self, cog_package: str, manifest: Dict[str, Any]):
+        """Register the commands of a lazy cog, loading it when one of them is invoked"""
+        async def load_and_dispatch(ctx: commands.Context):
+            await self.__load_lazy_cog(cog_package, manifest)
+            await ctx.bot.process_commands(ctx.message)
+
+        placeholders = []
+        for entry in manifest[cog_package]['commands']:
+            placeholder = commands.Command(
+                load_and_dispatch,
+                name=entry['name'],
+                aliases=entry['aliases'],
+                help=entry['help'],
+                ignore_extra=True
+            )
+            try:
+                self.bot.add_command(placeholder)
+            except commands.CommandRegistrationError as e:
+                self.logger.warning(f"Could not register lazy command for {cog_package}: {str(e)}")
+                continue
+            placeholders.append(placeholder)
+
+        self.bot._lazy_cogs[f'{self.base_cog_import_path}{cog_package}'] = placeholders
+
+    async def __load_cogs(
+        self,
+        cog_packages: List[str],
+        core: bool = False,
+        lazy: bool = False,
+        reload: bool = False
+    ) -> Dict[str, bool]:
+        """Load cogs concurrently, each one as soon as the cogs it requires are loaded"""
+        cogs_dir = self.__cogs_dir if not core else self.__core_commands_dir
+
+        if lazy:
+            manifest = self.read_manifest()
+            # A lazy cog loads its requirements under its lock, a cycle would never finish loading
+            listed = {cog_package: manifest[cog_package]['requires'] for cog_package in cog_packages if cog_package in manifest}
+            in_cycle = set(listed) - set(self.__sort_cogs(listed))
+            for cog_package in in_cycle:
+                self.skipped[cog_package] = "dependency cycle"
+            cog_packages = [cog_package for cog_package in cog_packages if cog_package not in in_cycle]
+
+            lazy_packages = {
+                cog_package for cog_package in cog_packages
+                if manifest.get(cog_package, {}).get('lazy')
+            }
+            # Cogs required by an eagerly loaded cog are loaded eagerly too
+            eager_packages = [cog_package for cog_package in cog_packages if cog_package not in lazy_packages]
+            while eager_packages:
+                requires = manifest.get(eager_packages.pop(), {}).get('requires', [])
+                for required in lazy_packages.intersection(requires):
+                    lazy_packages.discard(required)
+                    eager_packages.append(required)
+
+            for cog_package in sorted(lazy_packages):
+                self.__register_placeholders(cog_package, manifest)
+            cog_packages = [cog_package for cog_package in cog_packages if cog_package not in lazy_packages]
+
+        requirements: Dict[str, List[str]] = {}
+        for cog_package in cog_packages:
+            requires = self.__read_cog_package(os.path.join(cogs_dir, cog_package), core)
+            if requires is None:
+                self.logger.warning(f"Skipping {cog_package} due to invalid structure")
+                self.skipped[cog_package] = "invalid structure"
+                continue
+            requirements[cog_package] = requires
+
+        tasks: Dict[str, asyncio.Task] = {}
+
+        import_path = self.base_cog_import_path if not core else self.core_cog_import_path
 
-    async def init(self):
+        async def load_after_requirements(cog_package: str) -> bool:
+            for required in requirements[cog_package]:
+                if required in tasks:
+                    loaded = await tasks[required]
+                else:
+                    loaded = f'{import_path}{required}' in self.bot.extensions
+                if not loaded:
+                    self.logger.warning(f"Skipping {cog_package}: required cog {required} is not loaded")
+                    self.skipped[cog_package] = f"required cog {required} is not loaded"
+                    return False
+            return await self.__load_cog(cog_package, core, reload)
+
+        ordered = self.__sort_cogs(requirements)
+        for cog_package in set(requirements) - set(ordered):
+            self.skipped[cog_package] = "dependency cycle"
+
+        # Requirements are created first, so every task can await them
+        for cog_package in ordered:
+            tasks[cog_package] = asyncio.create_task(load_after_requirements(cog_package))
+
+        results = await asyncio.gather(*tasks.values())
+        return dict(zip(tasks, results))
+
+    async def reload_cogs(self, cog_packages: List[str]) -> Dict[str, bool]:
+        """
+        Reload loaded cogs concurrently, each one after the reloaded cogs it requires.
+        Returns whether each cog was reloaded, its duration is in `timings`
+        and the reason it was skipped in `skipped`.
+        """
+        self.__check_directory()
+        # A skipped cog has no timing, not the one of its last load
+        for cog_package in cog_packages:
+            self.timings.pop(cog_package, None)
+            self.skipped.pop(cog_package, None)
+        return await self.__load_cogs(cog_packages, reload=True)
+
+    async def init(self, lazy: bool = False):
+        """
+        Load the cogs and the core cogs.
+        With `lazy`, the cogs listed in the manifest are only loaded when one of their commands is first used.
+        """
         self.__check_directory()
 
         cog_packages = self.get_potential_packages()
         core_packages = self.get_potential_packages(core=True)
 
-        for cog_package in cog_packages:
-            await self.__load_cog(cog_package)
+        await asyncio.gather(
+            self.__load_cogs(cog_packages, lazy=lazy),
+            self.__load_cogs(core_packages, core=True)
+        )
 
-        for core_cog_package in core_packages:
-            await self.__load_cog(core_cog_package, core=True)
\ No newline at end of file
+if __name__ == '__main__':
+    import discord
+    manifest = CogLoader(commands.Bot(command_prefix='!', intents=discord.Intents.none())).write_manifest()
+    print(f"Wrote {len(manifest)} cogs to {CogLoader.manifest_path}")
@@ -4,57 +4,100 @@ import os
 import discord
 from discord.ext import commands
 
-from src.core._cog_loader import CogLoader
-from src.core._help_command import CustomHelpCommand, EmbedConfig
-from src.utils.commands import find_similar_commands
+from src.core._help_command import CustomHelpCommand
+from src.utils.logger import get_logs_dir
+from src.utils.profiler import profiler
 from .client import Client
 
-from rich import print
-from rich.console import Console
-
-console = Console()
+def _rich_print(*objects, **kwargs):
+    """rich's print, rich is only imported for the startup banner"""
+    from rich import print as rich_print
+    rich_print(*objects, **kwargs)
 
 def get_ready(bot: Client):
+    """Lightweight hooks, `on_ready` fires again after every reconnect"""
     @bot.event
     async def on_ready():
-        try:
-            await _on_ready()
-        except Exception as error:
-            tb_error = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
-            print(
-                "[bold red]Bot failed to be ready:[/bold red]\n\n" +
-                tb_error
-            )
-            sys.exit(1)
+        if bot._ready_once:
+            bot._logger.info(f"Reconnected as {bot.user}")
+            return
+
+        bot._ready_once = True
+        bot._logger.info(f"Ready, connected to {len(bot.guilds)} guilds")
+
+        if profiler.enabled:
+            profiler.stop('gateway connect', 'phase')
+            _print_startup_profile()
+
+    @bot.event
+    async def on_resumed():
+        bot._logger.info("Session resumed")
+
+def _print_startup_profile():
+    trace_path = profiler.trace_path or os.path.join(get_logs_dir(), 'startup_trace.json')
+    profiler.write_trace(trace_path)
+
+    phases = "\n".join(
+        f"{span.name}: [bold]{span.duration * 1000:.0f} ms[/bold]"
+        for span in profiler.spans if span.category == 'phase'
+    )
+    slowest = "\n".join(
+        f"{span.name}: [bold]{span.duration * 1000:.0f} ms[/bold]"
+        for span in profiler.slowest()
+    )
+    _rich_print(
+        f"Ready in [bold yellow]{profiler.elapsed():.2f} s[/bold yellow]",
+        f"Phases:\n{phases}",
+        f"Slowest:\n{slowest}",
+        f"Trace written to [cyan]{os.path.abspath(trace_path)}[/cyan]",
+        sep='\n\n',
+        end='\n\n'
+    )
+    profiler.finish()
+
+async def startup(bot: Client):
+    """Startup work, run once from `setup_hook` before connecting to the gateway"""
+    try:
+        await _startup(bot)
+    except Exception as error:
+        tb_error = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+        _rich_print(
+            "[bold red]Bot failed to start:[/bold red]\n\n" +
+            tb_error
+        )
+        sys.exit(1)
 
-    async def _define_infos_from_app():
-        app = await bot.application_info()
-        bot.owner_id = app.owner.id
-        bot.id = app.id
+async def _define_infos_from_app(bot: Client):
+    app = await bot.get_application_info()
+    bot.owner_id = app.owner.id
+    bot.id = app.id
 
-    async def _on_ready():
-        os.system('clear') # cls for win
+async def _startup(bot: Client):
+    from rich import get_console
+    get_console().clear()
 
-        await _define_infos_from_app()
+    with profiler.span('application_info'):
+        await _define_infos_from_app(bot)
 
-        logged_msg = f"Bot logged as [bold yellow]{bot.user}[/bold yellow]"
-        separator = '-' * (len(logged_msg) - (len('[bold yellow]') + len('[/bold yellow]')))
+    logged_msg = f"Bot logged as [bold yellow]{bot.user}[/bold yellow]"
+    separator = '-' * (len(logged_msg) - (len('[bold yellow]') + len('[/bold yellow]')))
 
-        print(logged_msg, separator, sep='\n')
+    _rich_print(logged_msg, separator, sep='\n')
 
-        await CogLoader(bot).init()
-        cogs = bot.get_cogs()
+    with profiler.span('CogLoader.init'):
+        await bot._cog_loader.init(lazy=bot.lazy_cogs)
+    cogs = bot.get_cogs()
 
-        loaded_msg = "Extensions [bold green]loaded[/bold green]:\n"
-        loaded_msg += ", ".join(sorted(cogs['loaded']))
+    loaded_msg = "Extensions [bold green]loaded[/bold green]:\n"
+    loaded_msg += ", ".join(sorted(cogs['loaded']))
 
-        unloaded_msg = "Extensions [bold red]not loaded[/bold red]:\n"
-        unloaded_msg += ", ".join(sorted(cogs['unloaded']))
+    unloaded_msg = "Extensions [bold red]not loaded[/bold red]:\n"
+    unloaded_msg += ", ".join(sorted(cogs['unloaded']))
 
-        print(loaded_msg, unloaded_msg, sep='\n\n')
+    _rich_print(loaded_msg, unloaded_msg, sep='\n\n')
 
-        invite_link = bot.get_invite_link()
-        print(separator, f"Invite link:\n[cyan]{invite_link}[/cyan]", sep='\n', end='\n\n')
+    invite_link = bot.get_invite_link()
+    _rich_print(separator, f"Invite link:\n[cyan]{invite_link}[/cyan]", sep='\n', end='\n\n')
 
 def setup_events(bot: Client):
     
@@ -68,17 +111,23 @@ def setup_events(bot: Client):
 
         if isinstance(error, commands.CommandNotFound):
             message_content = ctx.message.content.strip()
-            attempted_command = message_content[len(ctx.prefix):].split()[0]
+            attempted_words = message_content[len(ctx.prefix):].split()[:2]
+            if not attempted_words:
+                return
 
-            available_commands = [cmd for cmd in bot.commands]
-            similar_commands = find_similar_commands(attempted_command, available_commands)
+            # A mistyped group is matched with its subcommand first
+            command_index = bot.get_command_index()
+            similar_commands = (
+                len(attempted_words) > 1 and command_index.search(' '.join(attempted_words))
+            ) or command_index.search(attempted_words[0])
 
             if similar_commands:
                 suggestion = similar_commands[0]
+                help_command: CustomHelpCommand = bot.help_command
                 embed = discord.Embed(
-                    color=EmbedConfig().color,
+                    color=help_command.config.color,
                     title="Did you mean...?",
-                    description=f"**{ctx.prefix}{suggestion.name}** {CustomHelpCommand().get_command_help_preview(suggestion)}"
+                    description=f"**{ctx.prefix}{suggestion.qualified_name}** {help_command.get_command_help_preview(suggestion)}"
                 )
                 await ctx.reply(embed=embed)
 
@@ -1,22 +1,35 @@
+import importlib.machinery
 import logging
 import os
-from typing import List, Optional, Sequence, TypedDict, Union
+import time
+from typing import Dict, List, Optional, Sequence, TypedDict, Union
 import discord
 from discord.ext import commands
 
 from src.core._cog_loader import CogLoader
+from src.utils.commands import FuzzyIndex
 from src.utils.logger import init_logging
+from src.utils.profiler import profiler
+from src.utils.storage import BaseStorage
 from ._help_command import CustomHelpCommand
 
 class LoadedAndUnloadedCogs(TypedDict):
     loaded: List[str]
     unloaded: List[str]
 
+class CogStatus(TypedDict):
+    loaded: bool
+    error: Optional[str]
+
 class Client(commands.Bot):
     _last_error: str = None
+    _ready_once: bool = False
+    _application_info: Optional[discord.AppInfo] = None
     id: int
 
-    def __init__(self, command_prefix: str):
+    def __init__(self, command_prefix: str, lazy_cogs: bool = False):
+        profiler.start('Client.__init__')
+
         intents = discord.Intents.all()
         intents.message_content = True
         super().__init__(
@@ -25,11 +38,110 @@ class Client(commands.Bot):
             help_command=CustomHelpCommand()
         )
 
-        self._logger = init_logging('powipy', log_level=logging.INFO, file_log_level=logging.WARNING)
-        from ._events import get_ready
+        self.lazy_cogs = lazy_cogs
+        # Placeholder commands of the cogs waiting to be loaded on first use
+        self._lazy_cogs: Dict[str, List[commands.Command]] = {}
+
+        # Potential cogs, rescanned only when the ./cogs directory changes
+        self._cog_loader = CogLoader(self)
+        self._cog_inventory: Dict[str, CogStatus] = {}
+        self._cog_inventory_mtime: Optional[int] = None
+        # Source fingerprints of the loaded cogs, to reload only the changed ones
+        self._cog_fingerprints: Dict[str, str] = {}
+        # Fuzzy indexes for suggestions, rebuilt on first use after a change
+        self._command_index: Optional[FuzzyIndex[commands.Command]] = None
+        self._cog_name_index: Optional[FuzzyIndex[str]] = None
+
+        with profiler.span('init_logging'):
+            self._logger = init_logging('powipy', log_level=logging.INFO, file_log_level=logging.WARNING)
+        with profiler.span('import events'):
+            from ._events import get_ready
         get_ready(self)
 
+        profiler.stop('Client.__init__', 'phase')
+
+    async def load_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        placeholders = self._lazy_cogs.pop(name, [])
+        for placeholder in placeholders:
+            self.remove_command(placeholder.name)
+
+        try:
+            await super().load_extension(name, package=package)
+        except Exception as error:
+            for placeholder in placeholders:
+                self.add_command(placeholder)
+            self._lazy_cogs[name] = placeholders
+            self._set_cog_status(name, error)
+            raise
+
+        self._set_cog_status(name)
+
+    async def unload_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        await super().unload_extension(name, package=package)
+        self._set_cog_status(name)
+
+    async def reload_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        try:
+            await super().reload_extension(name, package=package)
+        except Exception as error:
+            self._set_cog_status(name, error)
+            raise
+
+        self._set_cog_status(name)
+
+    def _set_cog_status(self, extension: str, error: Optional[Exception] = None) -> None:
+        """
+        Update the cached inventory after a cog was loaded, unloaded or reloaded.
+        """
+        if not extension.startswith(CogLoader.base_cog_import_path):
+            return
+
+        cog = extension.replace(CogLoader.base_cog_import_path, "")
+        if cog not in self._cog_inventory:
+            self._cog_name_index = None
+        error = getattr(error, 'original', error)
+        self._cog_inventory[cog] = {
+            'loaded': extension in self.extensions,
+            'error': f"{type(error).__name__}: {error}" if error else None
+        }
+
+        if extension in self.extensions and not error:
+            self._cog_fingerprints[cog] = self._cog_loader.fingerprint(cog)
+        elif extension not in self.extensions:
+            self._cog_fingerprints.pop(cog, None)
+
+    def get_changed_cogs(self) -> List[str]:
+        """
+        Retrieve the loaded cogs whose source files changed since they were loaded.
+        """
+        return sorted(
+            cog for cog in self._get_loaded_cogs()
+            if self._cog_loader.fingerprint(cog) != self._cog_fingerprints.get(cog)
+        )
+
+    async def _load_from_module_spec(self, spec: importlib.machinery.ModuleSpec, key: str) -> None:
+        if not profiler.enabled:
+            return await super()._load_from_module_spec(spec, key)
+
+        # Split the import of the cog module from its setup
+        exec_module = spec.loader.exec_module
+        import_end = None
+
+        def timed_exec_module(module) -> None:
+            nonlocal import_end
+            with profiler.span(f'{key} import', 'cog'):
+                exec_module(module)
+            import_end = time.perf_counter()
+
+        spec.loader.exec_module = timed_exec_module
+        try:
+            await super()._load_from_module_spec(spec, key)
+        finally:
+            if import_end is not None:
+                profiler.record(f'{key} setup', import_end, time.perf_counter(), 'cog')
+
     async def setup_hook(self):
+        profiler.start('setup_hook')
         await super().setup_hook()
 
         from ._events import setup_events
@@ -39,6 +151,20 @@ class Client(commands.Bot):
         OnAppCommandErrorHandler.set_bot(self)
         self.tree.error(OnAppCommandErrorHandler.on_app_command_error)
 
+        from ._events import startup
+        await startup(self)
+
+        profiler.stop('setup_hook', 'phase')
+        profiler.start('gateway connect')
+
+    async def get_application_info(self) -> discord.AppInfo:
+        """
+        Retrieve the application info, fetched once and then cached.
+        """
+        if self._application_info is None:
+            self._application_info = await self.application_info()
+        return self._application_info
+
     def _get_loaded_cogs(self) -> List[str]:
         """
         Retrieve a list of names of loaded cogs in the bot.
@@ -49,14 +175,71 @@ class Client(commands.Bot):
             if not ext_name.startswith(CogLoader.core_cog_import_path)
         ]
     
-    def _get_unloaded_cogs(self) -> List[str]:
+    def get_cog_inventory(self) -> Dict[str, CogStatus]:
+        """
+        Retrieve the potential cogs of the ./cogs directory with their status and last load error.
+        The directory is only scanned again when its modification time changed.
+        """
+        mtime = self._cog_loader.get_directory_mtime()
+        if mtime is None or mtime != self._cog_inventory_mtime:
+            loaded = set(self._get_loaded_cogs())
+            self._cog_inventory = {
+                cog: {
+                    'loaded': cog in loaded,
+                    'error': self._cog_inventory.get(cog, {}).get('error')
+                }
+                for cog in self._cog_loader.get_potential_packages()
+            }
+            self._cog_inventory_mtime = mtime
+            self._cog_name_index = None
+
+        return self._cog_inventory
+
+    def find_similar_cogs(self, name: str, loaded: Optional[bool] = None) -> List[str]:
+        """
+        Retrieve the cog names close to the given name, optionally only the loaded or unloaded ones.
+        """
+        inventory = self.get_cog_inventory()
+        if self._cog_name_index is None:
+            self._cog_name_index = FuzzyIndex((cog, cog) for cog in inventory)
+
+        return [
+            cog for cog in self._cog_name_index.search(name)
+            if loaded is None or inventory.get(cog, {}).get('loaded') == loaded
+        ]
+
+    def add_command(self, command: commands.Command) -> None:
+        super().add_command(command)
+        self._command_index = None
+
+    def remove_command(self, name: str) -> Optional[commands.Command]:
+        self._command_index = None
+        return super().remove_command(name)
+
+    def get_command_index(self) -> FuzzyIndex[commands.Command]:
         """
-        Retrieve a list of unloaded cog filenames (without the .py extension) from the ./cogs directory.
+        Retrieve the fuzzy index of the commands names and aliases, subcommands included.
+        It is rebuilt after commands were added or removed, when cogs are loaded, unloaded or reloaded.
         """
-        potential_cogs = set(CogLoader(self).get_potential_packages())
-        loaded = set(self._get_loaded_cogs())
+        if self._command_index is None:
+            def names(command: commands.Command):
+                parent = f"{command.full_parent_name} " if command.parent else ""
+                for name in (command.name, *command.aliases):
+                    yield f"{parent}{name}", command
 
-        return sorted(list(potential_cogs - loaded), key=str.lower)
+            self._command_index = FuzzyIndex(
+                item for command in self.walk_commands() for item in names(command)
+            )
+        return self._command_index
+
+    def _get_unloaded_cogs(self) -> List[str]:
+        """
+        Retrieve a list of unloaded cog names from the cached inventory of the ./cogs directory.
+        """
+        return sorted(
+            [cog for cog, status in self.get_cog_inventory().items() if not status['loaded']],
+            key=str.lower
+        )
 
     def get_cogs(self) -> LoadedAndUnloadedCogs:
         """
@@ -78,7 +261,12 @@ class Client(commands.Bot):
 
     async def login(self, token: str) -> None:
         self._logger.info('Connecting to Discord...')
-        return await super().login(token)
+        with profiler.span('login', 'phase'):
+            return await super().login(token)
+
+    async def close(self) -> None:
+        await BaseStorage.close_all()
+        await super().close()
     
     def get_owner(self) -> discord.User:
         return self.get_user(self.owner_id)
@@ -1,9 +1,9 @@
+import asyncio
 import traceback
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 import discord
 from discord.ext import commands
 from discord.ui import Button
-import requests
 
 from src.core._cog_loader import CogLoader
 from src.core.client import Client
@@ -51,6 +51,57 @@ class ConfirmLeaveServer(discord.ui.View):
 class Owner(commands.Cog):
     def __init__(self, bot: Client):
         self.bot = bot
+        self._reload_watcher: Optional[asyncio.Task] = None
+
+    async def cog_unload(self) -> None:
+        if self._reload_watcher:
+            self._reload_watcher.cancel()
+
+    def _format_reload_report(self, cogs: List[str], results: Dict[str, bool]) -> str:
+        inventory = self.bot.get_cog_inventory()
+        lines = []
+        for cog in sorted(cogs):
+            timing = self.bot._cog_loader.timings.get(cog)
+            if timing is None:
+                reason = self.bot._cog_loader.skipped.get(cog, "see console")
+                lines.append(f"`{cog}` skipped: {reason}.")
+                continue
+
+            duration = f"{timing * 1000:.0f} ms"
+            if results[cog]:
+                lines.append(f"`{cog}` reloaded in {duration}.")
+            else:
+                error = inventory.get(cog, {}).get('error') or "see console"
+                lines.append(f"`{cog}` failed after {duration}: {error[:200]}")
+        return "\n".join(lines)[:2000]
+
+    def _did_you_mean(self, extension: str, loaded: Optional[bool] = None) -> str:
+        similar_cogs = self.bot.find_similar_cogs(extension, loaded)
+        return f" Did you mean `{similar_cogs[0]}`?" if similar_cogs else ""
+
+    async def _watch_cogs(self, interval: float):
+        """Reload the changed cogs every `interval` seconds"""
+        failed: Dict[str, Optional[str]] = {}
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # A cog failing to reload is retried once its files change again
+                changed = [
+                    cog for cog in self.bot.get_changed_cogs()
+                    if failed.get(cog) != self.bot._cog_loader.fingerprint(cog)
+                ]
+                if not changed:
+                    continue
+
+                results = await self.bot._cog_loader.reload_cogs(changed)
+                for cog in changed:
+                    if results.get(cog):
+                        failed.pop(cog, None)
+                    else:
+                        failed[cog] = self.bot._cog_loader.fingerprint(cog)
+                self.bot._logger.info(f"Watcher reload:\n{self._format_reload_report(changed, results)}")
+            except Exception as error:
+                self.bot._logger.error(f"Cogs watcher error: {error}", exc_info=True)
 
     @commands.command(help='List the loaded & unloaded cogs.')
     @commands.is_owner()
@@ -67,6 +118,14 @@ class Owner(commands.Cog):
         description = "{}".format(", ".join(sorted(cogs['unloaded'])))
 
         unload_cog = discord.Embed(title=title, description=description, color=0x992e22)
+
+        errors = [
+            f"**{cog}**: {status['error'][:200]}"
+            for cog, status in sorted(self.bot.get_cog_inventory().items())
+            if status['error'] and not status['loaded']
+        ]
+        if errors:
+            unload_cog.add_field(name="Last errors:", value="\n".join(errors)[:1024])
         await ctx.send(embed=load_cog)
         await ctx.send(embed=unload_cog)
 
@@ -77,7 +136,7 @@ class Owner(commands.Cog):
             await self.bot.load_extension(f'{CogLoader.base_cog_import_path}{extension}')
             await ctx.reply(f"`{extension}` loaded.")
         except commands.ExtensionNotFound:
-            await ctx.reply(f"Extension `{extension}` not found.")
+            await ctx.reply(f"Extension `{extension}` not found.{self._did_you_mean(extension, loaded=False)}")
         except Exception as error:
             tb_error = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
             self.bot._last_error = tb_error
@@ -91,21 +150,45 @@ class Owner(commands.Cog):
             await self.bot.unload_extension(f'{CogLoader.base_cog_import_path}{extension}')
             await ctx.reply(f"`{extension}` unloaded.")
         except commands.ExtensionNotLoaded:
-            await ctx.reply(f"Extension `{extension}` not loaded.")
+            await ctx.reply(f"Extension `{extension}` not loaded.{self._did_you_mean(extension, loaded=True)}")
         except Exception as error:
             tb_error = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
             self.bot._last_error = tb_error
             self.bot._logger.error(tb_error)
             raise error
 
-    @commands.command(help='Reload a specific cog.')
+    @commands.command(
+        help="Reload a specific cog, every cog with `*` or the changed ones with `changed`. "
+             "`watch [seconds]` toggles a watcher reloading the changed cogs, for development."
+    )
     @commands.is_owner()
-    async def reload(self, ctx: commands.Context, extension: str):
+    async def reload(self, ctx: commands.Context, extension: str, interval: float = 2.0):
+        if extension == 'watch':
+            if self._reload_watcher and not self._reload_watcher.done():
+                self._reload_watcher.cancel()
+                self._reload_watcher = None
+                await ctx.reply("Cogs watcher stopped.")
+            else:
+                self._reload_watcher = asyncio.create_task(self._watch_cogs(interval))
+                await ctx.reply(f"Watching the cogs for changes every {interval:g} seconds.")
+            return
+
+        if extension in ('*', 'changed'):
+            cogs = self.bot._get_loaded_cogs() if extension == '*' else self.bot.get_changed_cogs()
+            if not cogs:
+                await ctx.reply("No cog to reload.")
+                return
+
+            async with ctx.typing():
+                results = await self.bot._cog_loader.reload_cogs(cogs)
+            await ctx.reply(self._format_reload_report(cogs, results))
+            return
+
         try:
             await self.bot.reload_extension(f'{CogLoader.base_cog_import_path}{extension}')
             await ctx.reply(f"`{extension}` reloaded.")
         except commands.ExtensionNotLoaded:
-            await ctx.reply(f"Extension `{extension}` not loaded.")
+            await ctx.reply(f"Extension `{extension}` not loaded.{self._did_you_mean(extension, loaded=True)}")
         except Exception as error:
             tb_error = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
             self.bot._last_error = tb_error
@@ -170,6 +253,7 @@ class Owner(commands.Cog):
             if url.startswith("<") and url.endswith(">"):
                 url = url[1:-1]
 
+            import requests
             try:
                 response = requests.get(url)
                 response.raise_for_status()
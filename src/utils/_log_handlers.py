@@ -0,0 +1,210 @@
+import atexit
+from concurrent.futures import Executor
+from datetime import date, datetime
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .logger import LogConfig
+
+# Rotated files are compressed one at a time, away from the listener thread, from the first rotation
+_compressor: Optional[Executor] = None
+
+def _get_compressor() -> Executor:
+    global _compressor
+    if _compressor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='LogCompressor')
+    return _compressor
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """Rotate a log file by size and every day, rotated files are gzipped in the background"""
+
+    def __init__(self, filename: str, config: LogConfig):
+        super().__init__(filename, maxBytes=config.max_bytes, backupCount=config.backup_count)
+        self.config = config
+        self._day = (
+            date.fromtimestamp(os.path.getmtime(filename))
+            if os.path.exists(filename) else date.today()
+        )
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.config.daily and date.today() != self._day:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            root, ext = os.path.splitext(self.baseFilename)
+            rotated = f"{root}.{datetime.now():%Y%m%d_%H%M%S_%f}{ext}"
+            os.replace(self.baseFilename, rotated)
+            _get_compressor().submit(self._compress, rotated)
+
+        self._day = date.today()
+        if not self.delay:
+            self.stream = self._open()
+
+    def _compress(self, rotated: str) -> None:
+        import gzip
+        import shutil
+
+        try:
+            with open(rotated, 'rb') as source, gzip.open(f'{rotated}.gz', 'wb') as destination:
+                shutil.copyfileobj(source, destination)
+            os.remove(rotated)
+            self._apply_retention()
+        except Exception as error:
+            print(f"Error compressing log file {rotated}: {error}", file=sys.stderr)
+
+    def _apply_retention(self) -> None:
+        import re
+
+        directory, name = os.path.split(self.baseFilename)
+        root, ext = os.path.splitext(name)
+        # Only the archives of this log, not those of the loggers named after it like `<root>.storage`
+        pattern = re.compile(rf'{re.escape(root)}\.\d{{8}}_\d{{6}}_\d{{6}}{re.escape(ext)}\.gz')
+        # Timestamped names sort chronologically
+        archives = sorted(
+            (os.path.join(directory, entry) for entry in os.listdir(directory) if pattern.fullmatch(entry)),
+            reverse=True
+        )
+        expired = archives[self.config.backup_count:] if self.config.backup_count > 0 else []
+
+        if self.config.max_age_days > 0:
+            oldest = time.time() - self.config.max_age_days * 86400
+            expired += [archive for archive in archives if os.path.getmtime(archive) < oldest]
+
+        for archive in set(expired):
+            os.remove(archive)
+
+class RepeatLimiter:
+    """Let `burst` identical records through per `interval` seconds and count the others"""
+    max_windows = 1024
+
+    def __init__(self, burst: int, interval: float):
+        self.burst = burst
+        self.interval = interval
+        # Record key: [window start, records seen, first record]
+        self.windows: Dict[Tuple, list] = {}
+
+    def allow(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.pathname, record.lineno, record.getMessage())
+        window = self.windows.get(key)
+        if window is None:
+            if len(self.windows) >= self.max_windows:
+                self.windows.pop(next(iter(self.windows)))
+            self.windows[key] = [record.created, 1, record]
+            return True
+
+        window[1] += 1
+        return window[1] <= self.burst
+
+    def expired(self, now: float) -> List[logging.LogRecord]:
+        """Summaries of the windows over, for the records they suppressed"""
+        summaries = []
+        for key, (start, seen, record) in list(self.windows.items()):
+            if now - start < self.interval:
+                continue
+
+            del self.windows[key]
+            suppressed = seen - self.burst
+            if suppressed > 0:
+                first_line = record.getMessage().splitlines()[0][:200] if record.getMessage() else ''
+                summaries.append(logging.LogRecord(
+                    record.name, record.levelno, record.pathname, record.lineno,
+                    f"Suppressed {suppressed} similar messages in the last {self.interval:g}s: {first_line}",
+                    None, None
+                ))
+        return summaries
+
+class RoutingHandler(logging.Handler):
+    """Dispatch the records of the listener thread to the handlers of the logger they were queued by"""
+
+    def __init__(self):
+        super().__init__()
+        self.routes: Dict[str, List[logging.Handler]] = {}
+        self.limiters: Dict[str, RepeatLimiter] = {}
+
+    def _dispatch(self, route: str, record: logging.LogRecord) -> None:
+        for handler in self.routes.get(route, []):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def flush_suppressed(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        for route, limiter in list(self.limiters.items()):
+            for summary in limiter.expired(now):
+                self._dispatch(route, summary)
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        route = getattr(record, 'log_route', record.name)
+        self.flush_suppressed(record.created)
+
+        limiter = self.limiters.get(route)
+        if limiter is None or limiter.allow(record):
+            self._dispatch(route, record)
+        return True
+
+    def close(self) -> None:
+        self.flush_suppressed(float('inf'))
+        for handlers in self.routes.values():
+            for handler in handlers:
+                handler.close()
+        super().close()
+
+class RouteQueueHandler(QueueHandler):
+    """Queue the records tagged with the name of the logger they were logged to"""
+
+    def __init__(self, log_queue: queue.Queue, route: str):
+        super().__init__(log_queue)
+        self.route = route
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.log_route = self.route
+        return record
+
+class RoutingQueueListener(QueueListener):
+    """Queue listener writing the suppressed records summaries even when no record comes"""
+    tick = 1.0
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.tick)
+            except queue.Empty:
+                router.flush_suppressed()
+
+lock = threading.Lock()
+log_queue: queue.Queue = queue.Queue(-1)
+router = RoutingHandler()
+_listener: Optional[QueueListener] = None
+
+def start_listener() -> None:
+    global _listener
+    if _listener is None:
+        _listener = RoutingQueueListener(log_queue, router)
+        _listener.start()
+
+def stop_listener() -> None:
+    """Write the queued records and the pending summaries, and stop the listener thread"""
+    global _listener
+    with lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            router.flush_suppressed(float('inf'))
+
+atexit.register(stop_listener)
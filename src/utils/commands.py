@@ -1,33 +1,98 @@
+from collections import OrderedDict
 import os
-from typing import List
+from typing import Dict, Generic, Iterable, List, Optional, Set, Tuple, TypeVar
 import discord
-from discord.ext import commands
 from discord import app_commands
 
+T = TypeVar('T')
 
-def find_similar_commands(input_cmd: str, commands_list: List[commands.Command], score_limit: int = 2) -> List[commands.Command]:
-    """Find similar commands using Levenshtein distance"""
-    def levenshtein_distance(a: str, b: str) -> int:
-        if len(a) < len(b):
-            return levenshtein_distance(b, a)
-        if not b:
-            return len(a)
-        
-        previous_row = range(len(b) + 1)
-        for i, c1 in enumerate(a):
-            current_row = [i + 1]
-            for j, c2 in enumerate(b):
-                insertions = previous_row[j + 1] + 1
-                deletions = current_row[j] + 1
-                substitutions = previous_row[j] + (c1 != c2)
-                current_row.append(min(insertions, deletions, substitutions))
-            previous_row = current_row
-
-        return previous_row[-1]
-    
-    similarities = [(cmd, levenshtein_distance(input_cmd, cmd.name)) for cmd in commands_list]
-    similarities.sort(key=lambda x: x[1])
-    return [cmd for cmd, score in similarities if score <= score_limit]
+def levenshtein_distance(a: str, b: str, limit: Optional[int] = None) -> int:
+    """Levenshtein distance, or `limit + 1` as soon as it is known to be over `limit`"""
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    if not b:
+        return len(a)
+
+    previous_row = list(range(len(b) + 1))
+    for i, c1 in enumerate(a):
+        current_row = [i + 1]
+        for j, c2 in enumerate(b):
+            insertions = previous_row[j + 1] + 1
+            deletions = current_row[j] + 1
+            substitutions = previous_row[j] + (c1 != c2)
+            current_row.append(min(insertions, deletions, substitutions))
+        if limit is not None and min(current_row) > limit:
+            return limit + 1
+        previous_row = current_row
+
+    return previous_row[-1] if limit is None else min(previous_row[-1], limit + 1)
+
+def _deletions(word: str, distance: int) -> Set[str]:
+    """Every string obtained by deleting up to `distance` characters of a word"""
+    deletions = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        deletions |= frontier
+    return deletions
+
+class FuzzyIndex(Generic[T]):
+    """Index of names for fuzzy lookups
+
+    Each name is indexed under every string obtained by deleting up to
+    `max_distance` of its characters. A name within that edit distance of a query
+    shares at least one of them with the query, so a lookup only computes the
+    bounded distance to these candidates. Recent lookups are memoized.
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, T]], max_distance: int = 2, cache_size: int = 256):
+        self.max_distance = max_distance
+        self._values: Dict[str, List[T]] = {}
+        self._deletions: Dict[str, Set[str]] = {}
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_size = cache_size
+
+        for name, value in items:
+            self._values.setdefault(name.lower(), []).append(value)
+        for name in self._values:
+            for deletion in _deletions(name, max_distance):
+                self._deletions.setdefault(deletion, set()).add(name)
+        self._longest = max(map(len, self._values), default=0)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def search(self, query: str, score_limit: int = 2) -> List[T]:
+        """Values whose name is within `score_limit` of the query, closest first"""
+        query = query.lower()
+        key = (query, score_limit)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        if len(query) > self._longest + score_limit:
+            candidates: Iterable[str] = ()
+        elif score_limit > self.max_distance:
+            candidates = self._values
+        else:
+            candidates = set()
+            for deletion in _deletions(query, score_limit):
+                candidates |= self._deletions.get(deletion, set())
+
+        scored = sorted(
+            (distance, name) for name in candidates
+            if (distance := levenshtein_distance(query, name, score_limit)) <= score_limit
+        )
+        results: List[T] = []
+        for _, name in scored:
+            results.extend(value for value in self._values[name] if value not in results)
+
+        self._cache[key] = results
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return results
 
 def app_command_main_guild():
     """Decorator for restricting app commands to the main guild"""
@@ -1,7 +1,34 @@
+from dataclasses import dataclass
 import logging
 import os
 from typing import Optional
 
+@dataclass
+class LogConfig:
+    """Rotation, retention and repeat limits of the log files
+
+    Every field can be set from the environment, e.g. `LOG_MAX_BYTES=1048576`.
+    """
+    max_bytes: int = 10 * 1024 * 1024       # rotate when a file is bigger, 0 to disable
+    daily: bool = True                      # rotate when the day changes
+    backup_count: int = 14                  # compressed files kept per log
+    max_age_days: int = 30                  # compressed files older are deleted, 0 to disable
+    repeat_burst: int = 5                   # identical records let through per interval, 0 to disable
+    repeat_interval: float = 60.0           # seconds
+
+    @classmethod
+    def from_env(cls) -> 'LogConfig':
+        config = cls()
+        for name, default in vars(cls()).items():
+            value = os.getenv(f'LOG_{name.upper()}')
+            if value is None or value.strip() == '':
+                continue
+            if isinstance(default, bool):
+                setattr(config, name, value.strip().lower() in ('1', 'true', 'yes'))
+            else:
+                setattr(config, name, type(default)(value))
+        return config
+
 def _get_formatter() -> logging.Formatter:
     return logging.Formatter(
         "[{asctime}] [{levelname}] {name}: {message}",
@@ -15,10 +42,12 @@ def get_logs_dir() -> str:
 
     return logs_dir
 
-def _get_file_handler(log_name: str, log_level: int) -> logging.FileHandler:
+def _get_file_handler(log_name: str, log_level: int, config: LogConfig) -> logging.FileHandler:
+    from ._log_handlers import CompressingRotatingFileHandler
+
     logs_dir = get_logs_dir()
 
-    file_handler = logging.FileHandler(os.path.join(logs_dir, f'{log_name}.log'))
+    file_handler = CompressingRotatingFileHandler(os.path.join(logs_dir, f'{log_name}.log'), config)
     file_handler.setLevel(log_level)
     file_handler.setFormatter(_get_formatter())
 
@@ -31,14 +60,43 @@ def _get_console_handler(log_level: int) -> logging.StreamHandler:
 
     return console_handler
 
-def init_logging(log_name: str, log_level: int, file_log_level: Optional[int] = None) -> logging.Logger:
+def shutdown_logging() -> None:
+    """Write the queued records and the pending summaries, and stop the listener thread"""
+    from ._log_handlers import stop_listener
+    stop_listener()
+
+def init_logging(
+    log_name: str,
+    log_level: int,
+    file_log_level: Optional[int] = None,
+    config: Optional[LogConfig] = None
+) -> logging.Logger:
+    """Set up a logger writing to logs/<log_name>.log and the console, from a single listener thread
+
+    Calling it again for the same name only updates the levels. The config
+    defaults to `LogConfig.from_env()`.
+    """
+    # The queue listener machinery is only imported once a logger is set up
+    from ._log_handlers import RepeatLimiter, RouteQueueHandler, lock, log_queue, router, start_listener
+
     logger = logging.getLogger(log_name)
     logger.setLevel(log_level)
 
-    file_handler = _get_file_handler(log_name, file_log_level if file_log_level else log_level)
-    console_handler = _get_console_handler(log_level)
+    with lock:
+        handlers = router.routes.get(log_name)
+        if handlers:
+            file_handler, console_handler = handlers
+            file_handler.setLevel(file_log_level if file_log_level else log_level)
+            console_handler.setLevel(log_level)
+            return logger
+
+        config = config or LogConfig.from_env()
+        file_handler = _get_file_handler(log_name, file_log_level if file_log_level else log_level, config)
+        console_handler = _get_console_handler(log_level)
+        router.routes[log_name] = [file_handler, console_handler]
+        router.limiters[log_name] = RepeatLimiter(config.repeat_burst, config.repeat_interval)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+        logger.addHandler(RouteQueueHandler(log_queue, log_name))
+        start_listener()
 
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+@dataclass
+class ProfiledSpan:
+    name: str
+    category: str
+    start: float
+    duration: float
+
+class StartupProfiler:
+    """Record the duration of the startup phases, disabled by default
+
+    Spans are grouped by category: `phase` for the main startup phases, `step`
+    for the work done inside them and `cog` for the cogs import and setup.
+    """
+    categories = ('phase', 'step', 'cog')
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self.spans: List[ProfiledSpan] = []
+        self.trace_path: Optional[str] = None
+        self._started: Dict[str, float] = {}
+
+    def enable(self, origin: Optional[float] = None, trace_path: Optional[str] = None) -> None:
+        """Start recording, times are relative to `origin`, a `time.perf_counter()` value"""
+        self.enabled = True
+        self.trace_path = trace_path
+        if origin is not None:
+            self.origin = origin
+
+    def finish(self) -> None:
+        """Stop recording, later spans like lazy cog loads are not part of the startup"""
+        self.enabled = False
+        self._started.clear()
+
+    def record(self, name: str, start: float, end: float, category: str = 'step') -> None:
+        if self.enabled:
+            self.spans.append(ProfiledSpan(name, category, start - self.origin, end - start))
+
+    @contextmanager
+    def span(self, name: str, category: str = 'step') -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), category)
+
+    def start(self, name: str) -> None:
+        """Start a span ending in another function, with `stop`"""
+        if self.enabled:
+            self._started[name] = time.perf_counter()
+
+    def stop(self, name: str, category: str = 'step') -> None:
+        start = self._started.pop(name, None)
+        if start is not None:
+            self.record(name, start, time.perf_counter(), category)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def slowest(self, count: int = 5, categories: tuple = ('step', 'cog')) -> List[ProfiledSpan]:
+        spans = [span for span in self.spans if span.category in categories]
+        return sorted(spans, key=lambda span: span.duration, reverse=True)[:count]
+
+    def to_trace(self) -> Dict[str, Any]:
+        """Trace in the Chrome trace event format, readable by chrome://tracing or Perfetto"""
+        return {
+            'displayTimeUnit': 'ms',
+            'traceEvents': [
+                {
+                    'name': span.name,
+                    'cat': span.category,
+                    'ph': 'X',
+                    'ts': span.start * 1e6,
+                    'dur': span.duration * 1e6,
+                    'pid': os.getpid(),
+                    'tid': self.categories.index(span.category) if span.category in self.categories else 0,
+                }
+                for span in self.spans
+            ],
+            'spans': [asdict(span) for span in self.spans],
+        }
+
+    def write_trace(self, file_path: str) -> None:
+        with open(file_path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_trace(), file, indent=2)
+
+profiler = StartupProfiler()
@@ -0,0 +1,222 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import logging
+from pathlib import Path
+import sqlite3
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, TypeVar
+
+from .storage import BaseStorage
+
+T = TypeVar('T')
+
+class SQLiteStorage(BaseStorage):
+    """SQLite storage implementation
+
+    Each key is stored in its own row with a JSON encoded value, so an update
+    only writes that row. The database runs in WAL mode and every query is
+    executed in a dedicated worker thread owning the connection.
+    """
+    storage_name: str
+
+    def __init__(self, storage_name: str, *, storage_dir: Optional[Path] = None):
+        self.logger = logging.getLogger(f'{storage_name}Storage')
+        self.storage_name = storage_name
+        self._connection: Optional[sqlite3.Connection] = None
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{storage_name}Storage')
+
+        # Get project root directory
+        self.project_root = Path(__file__).parent.parent.parent
+
+        # Set up storage paths
+        self.storage_dir = Path(storage_dir) if storage_dir else self.project_root / 'data'
+        self.backup_dir = self.storage_dir / 'backup'
+        self.file_path = self.storage_dir / f'{storage_name.lower()}.sqlite3'
+
+        # Create directories if they don't exists
+        self.storage_dir.mkdir(exist_ok=True)
+        self.backup_dir.mkdir(exist_ok=True)
+
+        # Create the schema
+        self._executor.submit(self._create_tables).result()
+
+        BaseStorage._instances.add(self)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get the connection, only called from the worker thread"""
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.file_path)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+        return self._connection
+
+    def _create_tables(self) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS storage (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+            )
+
+    async def _run(self, function: Callable[..., T], *args: Any) -> T:
+        """Run a function in the worker thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    @staticmethod
+    def _encode(value: Any) -> str:
+        return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+    def _create_backup(self) -> None:
+        """Create a backup of the database, only called from the worker thread"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        backup_path = self.backup_dir / f'{self.storage_name.lower()}_{timestamp}.sqlite3'
+        try:
+            with sqlite3.connect(backup_path) as backup:
+                self._connect().backup(backup)
+            self.logger.info(f"Created backup: {backup_path}")
+        except Exception as error:
+            self.logger.error(f"Error creating backup: {error}")
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        """Get value from storage"""
+        def query() -> Any:
+            row = self._connect().execute('SELECT value FROM storage WHERE key = ?', (key,)).fetchone()
+            return json.loads(row[0]) if row else default
+
+        return await self._run(query)
+
+    async def set(self, key: str, value: Any) -> None:
+        """Set value in storage"""
+        def query() -> None:
+            with self._connect() as connection:
+                connection.execute(
+                    'INSERT INTO storage (key, value) VALUES (?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                    (key, self._encode(value))
+                )
+
+        await self._run(query)
+
+    async def delete(self, key: str) -> bool:
+        """Delete value from storage"""
+        def query() -> bool:
+            with self._connect() as connection:
+                return connection.execute('DELETE FROM storage WHERE key = ?', (key,)).rowcount > 0
+
+        return await self._run(query)
+
+    async def clear(self) -> None:
+        """Clear all data from storage"""
+        def query() -> None:
+            self._create_backup()
+            with self._connect() as connection:
+                connection.execute('DELETE FROM storage')
+
+        await self._run(query)
+
+    async def get_all(self) -> Dict[str, Any]:
+        """Get all stored data"""
+        def query() -> Dict[str, Any]:
+            rows = self._connect().execute('SELECT key, value FROM storage').fetchall()
+            return {key: json.loads(value) for key, value in rows}
+
+        return await self._run(query)
+
+    async def close(self) -> None:
+        """Close the connection and stop the worker thread"""
+        def close_connection() -> None:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        if self._closed:
+            return
+
+        self._closed = True
+        await self._run(close_connection)
+        self._executor.shutdown()
+
+class SQLiteGuildStorage(SQLiteStorage):
+    """Specialized SQLite storage for guild-specific data
+
+    Guild data is stored one row per (guild, key) pair, so reading a guild only
+    loads its own rows.
+    """
+
+    def _create_tables(self) -> None:
+        super()._create_tables()
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS guild_storage ('
+                'guild_id INTEGER NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                'PRIMARY KEY (guild_id, key))'
+            )
+
+    async def get_guild_data(self, guild_id: int) -> Mapping[str, Any]:
+        """Get a read-only snapshot of all data for specific guild"""
+        def query() -> Dict[str, Any]:
+            rows = self._connect().execute(
+                'SELECT key, value FROM guild_storage WHERE guild_id = ?', (guild_id,)
+            ).fetchall()
+            return {key: json.loads(value) for key, value in rows}
+
+        return MappingProxyType(await self._run(query))
+
+    async def set_guild_data(self, guild_id: int, key: str, value: Any) -> None:
+        """Set data for specific guild"""
+        def query() -> None:
+            with self._connect() as connection:
+                connection.execute(
+                    'INSERT INTO guild_storage (guild_id, key, value) VALUES (?, ?, ?) '
+                    'ON CONFLICT(guild_id, key) DO UPDATE SET value = excluded.value',
+                    (guild_id, key, self._encode(value))
+                )
+
+        await self._run(query)
+
+    async def update_guild_data(self, guild_id: int, values: Mapping[str, Any]) -> None:
+        """Set several data for specific guild, saved at once"""
+        def query() -> None:
+            with self._connect() as connection:
+                connection.executemany(
+                    'INSERT INTO guild_storage (guild_id, key, value) VALUES (?, ?, ?) '
+                    'ON CONFLICT(guild_id, key) DO UPDATE SET value = excluded.value',
+                    [(guild_id, key, self._encode(value)) for key, value in values.items()]
+                )
+
+        await self._run(query)
+
+    async def delete_guild_data(self, guild_id: int) -> None:
+        """Delete all data for specific guild"""
+        def query() -> None:
+            with self._connect() as connection:
+                connection.execute('DELETE FROM guild_storage WHERE guild_id = ?', (guild_id,))
+
+        await self._run(query)
+
+    async def get_all(self) -> Dict[str, Any]:
+        """Get all stored data, the data of each guild under its id"""
+        def query() -> Dict[str, Any]:
+            connection = self._connect()
+            data = {
+                key: json.loads(value)
+                for key, value in connection.execute('SELECT key, value FROM storage')
+            }
+            rows = connection.execute('SELECT guild_id, key, value FROM guild_storage ORDER BY guild_id')
+            for guild_id, key, value in rows:
+                data.setdefault(str(guild_id), {})[key] = json.loads(value)
+            return data
+
+        return await self._run(query)
+
+    async def clear(self) -> None:
+        """Clear all data, guilds included, from storage"""
+        def query() -> None:
+            self._create_backup()
+            with self._connect() as connection:
+                connection.execute('DELETE FROM storage')
+                connection.execute('DELETE FROM guild_storage')
+
+        await self._run(query)
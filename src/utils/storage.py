@@ -1,14 +1,503 @@
 from abc import ABC, abstractmethod
 import asyncio
+from collections import OrderedDict
+import collections.abc
+from collections.abc import MutableMapping
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import MISSING, dataclass, fields, is_dataclass, replace
 from datetime import datetime
+import gzip
+import inspect
+import io
 import json
+from json.encoder import encode_basestring
+import json.scanner
 import logging
+import mmap
+import os
 from pathlib import Path
+import pickle
+import re
 import shutil
-from typing import Any, Dict
+import time
+from types import MappingProxyType
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, FrozenSet, Iterable, Iterator, List,
+    Literal, Mapping, Optional, Sequence, Set, Tuple, Union, get_args, get_origin, get_type_hints
+)
+import weakref
+import zlib
+
+from .parser import SetParser
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+_MISSING = object()
+
+class BoundsError(ValueError):
+    """Raised when a numeric operation would take a value out of its bounds"""
+
+class SchemaError(ValueError):
+    """Raised when guild settings don't match the storage schema"""
+
+def _matches_type(value: Any, annotation: Any) -> bool:
+    """Check a JSON-like value against a type annotation"""
+    if annotation is Any:
+        return True
+
+    origin = get_origin(annotation)
+    arguments = get_args(annotation)
+
+    if origin is Union:
+        return any(_matches_type(value, argument) for argument in arguments)
+    if origin is Literal:
+        return value in arguments
+    if origin in (list, collections.abc.Sequence):
+        if not isinstance(value, list):
+            return False
+        return not arguments or all(_matches_type(item, arguments[0]) for item in value)
+    if origin in (dict, collections.abc.Mapping):
+        if not isinstance(value, dict):
+            return False
+        return not arguments or all(
+            _matches_type(key, arguments[0]) and _matches_type(item, arguments[1])
+            for key, item in value.items()
+        )
+
+    if annotation is type(None):
+        return value is None
+    if annotation is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if annotation is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, annotation)
+
+class _Schema:
+    """Fields, types and defaults of a settings dataclass"""
+
+    def __init__(self, record_type: type):
+        if not is_dataclass(record_type):
+            raise TypeError(f"{record_type.__name__} must be a dataclass")
+
+        self.record_type = record_type
+        self.types = get_type_hints(record_type)
+        self.defaults: Dict[str, Any] = {}
+        for field in fields(record_type):
+            if field.default is not MISSING:
+                self.defaults[field.name] = field.default
+            elif field.default_factory is not MISSING:
+                self.defaults[field.name] = field.default_factory()
+            else:
+                raise TypeError(f"Field {field.name} of {record_type.__name__} needs a default value")
+
+    def validate(self, values: Mapping[str, Any]) -> None:
+        for key, value in values.items():
+            if key not in self.types:
+                raise SchemaError(f"Unknown setting {key} for {self.record_type.__name__}")
+            if not _matches_type(value, self.types[key]):
+                raise SchemaError(f"Invalid value for {key}: {value!r} is not {self.types[key]}")
+
+    def hydrate(self, data: Mapping[str, Any]) -> Any:
+        return self.record_type(**{key: value for key, value in data.items() if key in self.types})
+
+    def dehydrate(self, record: Any) -> Dict[str, Any]:
+        return {name: getattr(record, name) for name in self.types}
+
+class StorageCodec(ABC):
+    """Serialisation format of a storage file"""
+    name: str
+    extension: str
+
+    @abstractmethod
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        pass
+
+    @abstractmethod
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        pass
+
+class JSONCodec(StorageCodec):
+    """Compact JSON, or pretty-printed JSON for debugging when `indent` is set"""
+    extension = '.json'
+
+    def __init__(self, name: str, indent: Optional[int] = None):
+        self.name = name
+        self.indent = indent
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        separators = None if self.indent else (',', ':')
+        return json.dumps(data, indent=self.indent, separators=separators, ensure_ascii=False).encode('utf-8')
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        return json.loads(payload)
+
+class _SafeUnpickler(pickle.Unpickler):
+    """Unpickler refusing any global outside of a few builtin containers"""
+    allowed_globals = {('builtins', 'set'), ('builtins', 'frozenset'), ('builtins', 'complex')}
+
+    def find_class(self, module: str, name: str) -> Any:
+        if (module, name) in self.allowed_globals:
+            return super().find_class(module, name)
+        raise pickle.UnpicklingError(f"Forbidden global in storage file: {module}.{name}")
+
+class _SafePickler(pickle.Pickler):
+    """Pickler refusing the values `_SafeUnpickler` could not load back"""
+    allowed_types = (type(None), bool, int, float, complex, str, bytes, list, tuple, dict, set, frozenset)
+
+    def reducer_override(self, obj: Any) -> Any:
+        # The classes are pickled by the reduction of their instances, like complex
+        if type(obj) in self.allowed_types or (isinstance(obj, type) and obj in (set, frozenset, complex)):
+            return NotImplemented
+        raise pickle.PicklingError(f"Values of type {type(obj).__name__} can't be stored with the pickle codec")
+
+class PickleCodec(StorageCodec):
+    """Compact binary format, loaded without executing arbitrary code"""
+    name = 'pickle'
+    extension = '.pickle'
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        buffer = io.BytesIO()
+        _SafePickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(data)
+        return buffer.getvalue()
+
+    def loads(self, payload: bytes) -> Dict[str, Any]:
+        return _SafeUnpickler(io.BytesIO(payload)).load()
+
+CODECS: Dict[str, StorageCodec] = {
+    'json': JSONCodec('json'),
+    'json-pretty': JSONCodec('json-pretty', indent=2),
+    'pickle': PickleCodec(),
+}
+
+def detect_codec(payload: bytes) -> StorageCodec:
+    """Guess the codec of a storage file from its content"""
+    if payload[:1] == b'\x80':  # pickle protocol marker
+        return CODECS['pickle']
+    return CODECS['json']
+
+def convert_storage_file(source: Path, codec: str, destination: Optional[Path] = None) -> Path:
+    """Convert a storage file to another codec, next to the source by default"""
+    target_codec = CODECS[codec]
+    payload = source.read_bytes()
+    data = detect_codec(payload).loads(payload)
+
+    destination = destination or source.with_suffix(target_codec.extension)
+    tmp_path = destination.with_name(f'{destination.name}.tmp')
+    tmp_path.write_bytes(target_codec.dumps(data))
+    os.replace(tmp_path, destination)
+
+    return destination
+
+class BackupManager:
+    """Compressed and rotated backups of a storage
+
+    Full backups are gzip-compressed storage files. Delta backups only hold the
+    keys changed since the last full backup, and are restored on top of it.
+    Backups beyond `max_backups` full backups, or older than `max_age` seconds,
+    are removed, the most recent full backup is always kept.
+    """
+
+    def __init__(
+        self,
+        storage: 'JSONStorage',
+        *,
+        max_backups: int = 10,
+        max_age: Optional[float] = 30 * 24 * 3600,
+        compress_level: int = 6
+    ):
+        self.storage = storage
+        self.max_backups = max_backups
+        self.max_age = max_age
+        self.compress_level = compress_level
+        self._changed_keys: Set[str] = set()
+        self._full_needed = True
+        self._last_full: Optional[Path] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def prefix(self) -> str:
+        return f'{self.storage.storage_name.lower()}_'
+
+    @property
+    def pattern(self) -> 're.Pattern[str]':
+        """Backup names of the storage, the timestamp keeps `guild` from matching `guild_settings` backups"""
+        return re.compile(rf'{re.escape(self.prefix)}\d{{8}}_\d{{6}}(_\d{{6}})?(\.delta)?(\.\w+)+')
+
+    def _backup_path(self, kind: str) -> Path:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        extension = self.storage.codec.extension
+        return self.storage.backup_dir / f'{self.prefix}{timestamp}{kind}{extension}.gz'
+
+    def _write(self, backup_path: Path, payload: bytes) -> None:
+        tmp_path = backup_path.with_name(f'{backup_path.name}.tmp')
+        with gzip.open(tmp_path, 'wb', compresslevel=self.compress_level) as file:
+            file.write(payload)
+        os.replace(tmp_path, backup_path)
+
+    def track(self, keys: Optional[Iterable[str]]) -> None:
+        """Record the keys changed since the last full backup, `None` meaning every key"""
+        if keys is None:
+            self._full_needed = True
+        else:
+            self._changed_keys.update(keys)
+
+    @property
+    def has_changes(self) -> bool:
+        return self._full_needed or bool(self._changed_keys)
+
+    def backup_file(self) -> Optional[Path]:
+        """Compress a copy of the storage file as it is on disk"""
+        if not self.storage.file_path.exists():
+            return None
+
+        backup_path = self._backup_path('')
+        self._write(backup_path, self.storage.file_path.read_bytes())
+        self.rotate()
+        return backup_path
+
+    def _write_snapshot(self, data: Dict[str, Any]) -> Path:
+        backup_path = self._backup_path('')
+        self._write(backup_path, self.storage.codec.dumps(data))
+        self.rotate()
+        return backup_path
+
+    def _write_delta(self, data: Dict[str, Any], changed_keys: Set[str], base: Path) -> Path:
+        payload = {
+            'base': base.name,
+            'set': {key: data[key] for key in changed_keys if key in data},
+            'deleted': [key for key in changed_keys if key not in data],
+        }
+        backup_path = self._backup_path('.delta')
+        self._write(backup_path, self.storage.codec.dumps(payload))
+        self.rotate()
+        return backup_path
+
+    def _take_changes(self) -> Tuple[Set[str], bool]:
+        """Reset the changes a full backup covers, on the event loop along with the data copy"""
+        changes = self._changed_keys, self._full_needed
+        self._changed_keys, self._full_needed = set(), False
+        return changes
+
+    def _restore_changes(self, changed_keys: Set[str], full_needed: bool) -> None:
+        """Give the changes of a failed full backup back to the next one"""
+        self._changed_keys |= changed_keys
+        self._full_needed = self._full_needed or full_needed
+
+    def snapshot(self, data: Dict[str, Any]) -> Path:
+        """Write a full backup of the data, from the event loop thread"""
+        changes = self._take_changes()
+        try:
+            self._last_full = self._write_snapshot(data)
+        except BaseException:
+            self._restore_changes(*changes)
+            raise
+        return self._last_full
+
+    async def write_snapshot(self, data: Dict[str, Any]) -> Path:
+        """Write a full backup of the data in a worker thread
+
+        The changes committed while it is written go to the next backup.
+        """
+        changes = self._take_changes()
+        try:
+            self._last_full = await asyncio.to_thread(self._write_snapshot, data)
+        except BaseException:
+            self._restore_changes(*changes)
+            raise
+        return self._last_full
+
+    async def write_delta(self, data: Dict[str, Any]) -> Path:
+        """Write the keys changed since the last full backup in a worker thread"""
+        if self._last_full is None or not self._last_full.exists():
+            return await self.write_snapshot(data)
+        return await asyncio.to_thread(self._write_delta, data, set(self._changed_keys), self._last_full)
+
+    def list_backups(self) -> List[Path]:
+        """Backups of the storage, oldest first"""
+        return sorted(
+            path for path in self.storage.backup_dir.glob(f'{self.prefix}*')
+            if path.is_file() and not path.name.endswith('.tmp') and self.pattern.fullmatch(path.name)
+        )
+
+    def rotate(self) -> None:
+        """Remove the backups exceeding the count or age limits"""
+        backups = self.list_backups()
+        full_backups = [path for path in backups if '.delta' not in path.name]
+        expired = set(full_backups[:-self.max_backups]) if self.max_backups else set()
+
+        if self.max_age is not None:
+            oldest_allowed = time.time() - self.max_age
+            expired.update(path for path in full_backups[:-1] if path.stat().st_mtime < oldest_allowed)
+
+        remaining = {path.name for path in full_backups} - {path.name for path in expired}
+        for path in backups:
+            if path not in expired and '.delta' in path.name and not self._has_base(path, remaining):
+                expired.add(path)
+
+        for path in expired:
+            try:
+                path.unlink()
+                self.storage.logger.info(f"Removed backup: {path}")
+            except OSError as error:
+                self.storage.logger.error(f"Error removing backup {path}: {error}")
+
+    def _has_base(self, delta_path: Path, full_backups: Set[str]) -> bool:
+        try:
+            return self._read(delta_path)['base'] in full_backups
+        except Exception:
+            return False
+
+    @staticmethod
+    def _read(backup_path: Path) -> Any:
+        if backup_path.suffix == '.gz':
+            with gzip.open(backup_path, 'rb') as file:
+                payload = file.read()
+        else:
+            payload = backup_path.read_bytes()
+        return detect_codec(payload).loads(payload)
+
+    def load(self, backup_path: Optional[Path] = None) -> Dict[str, Any]:
+        """Read the data of a backup, the most recent one by default"""
+        if backup_path is None:
+            backups = self.list_backups()
+            if not backups:
+                raise FileNotFoundError(f"No backup found for {self.storage.storage_name}")
+            backup_path = backups[-1]
+
+        if '.delta' not in backup_path.name:
+            return self._read(backup_path)
+
+        delta = self._read(backup_path)
+        data = self._read(backup_path.with_name(delta['base']))
+        data.update(delta['set'])
+        for key in delta['deleted']:
+            data.pop(key, None)
+        return data
+
+    def schedule(self, interval: float, delta_interval: Optional[float] = None) -> None:
+        """Start backing up the storage in the background
+
+        A full backup is written every `interval` seconds and, if `delta_interval`
+        is set, a delta backup every `delta_interval` seconds in between.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(interval, delta_interval))
+
+    async def _run(self, interval: float, delta_interval: Optional[float]) -> None:
+        last_full = time.monotonic()
+        while True:
+            await asyncio.sleep(min(interval, delta_interval or interval))
+            if not self.has_changes:
+                continue
+
+            # Values are replaced rather than mutated in place, a shallow copy is a stable snapshot
+            data = dict(self.storage._data)
+            try:
+                if delta_interval is None or self._full_needed or time.monotonic() - last_full >= interval:
+                    await self.write_snapshot(data)
+                    last_full = time.monotonic()
+                else:
+                    await self.write_delta(data)
+            except Exception as error:
+                self.storage.logger.error(f"Error creating backup: {error}")
+
+    def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+@dataclass(frozen=True)
+class StorageChange:
+    """Keys changed by a committed mutation or transaction"""
+    storage_name: str
+    keys: FrozenSet[str]
+    cleared: bool = False
+
+class Subscription:
+    """Callback subscribed to the changes of a storage, see `JSONStorage.subscribe`"""
+
+    def __init__(
+        self,
+        storage: 'JSONStorage',
+        callback: Callable[[StorageChange], Union[None, Awaitable[None]]],
+        keys: Optional[FrozenSet[str]]
+    ):
+        self.storage = storage
+        self.callback = callback
+        self.keys = keys
+
+    def matches(self, change: StorageChange) -> Optional[StorageChange]:
+        """The part of a change this subscription is interested in, if any"""
+        if self.keys is None or change.cleared:
+            return change
+        keys = change.keys & self.keys
+        return replace(change, keys=keys) if keys else None
+
+    def cancel(self) -> None:
+        """Stop receiving changes"""
+        if self in self.storage._subscriptions:
+            self.storage._subscriptions.remove(self)
+
+class _DataView(collections.abc.Mapping):
+    """Read-only view of the data of a storage, following it when the data object is replaced"""
+    __slots__ = ('_storage',)
+
+    def __init__(self, storage: 'JSONStorage'):
+        self._storage = storage
+
+    def __getitem__(self, key: str) -> Any:
+        return self._storage._data[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._storage._data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._storage._data)
+
+    def __len__(self) -> int:
+        return len(self._storage._data)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({dict(self)!r})'
+
+class _ProcessLock:
+    """Advisory lock on a file shared by every process using a storage"""
+
+    def __init__(self, lock_path: Path):
+        self.lock_path = lock_path
+        self._file = None
+
+    def acquire(self) -> None:
+        # A second handle would be unlocked by the release of the first holder
+        if self._file is not None:
+            raise RuntimeError(f"Process lock {self.lock_path} is already held")
+        self._file = open(self.lock_path, 'a')
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def release(self) -> None:
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> '_ProcessLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
 
 class BaseStorage(ABC):
     """Abstract base class defining storage interface"""
+    _instances: 'weakref.WeakSet[BaseStorage]' = weakref.WeakSet()
+    _shared: Dict[Tuple[Path, str], 'BaseStorage'] = {}
+    _shared_key: Optional[Tuple[Path, str]] = None
+    _references: int = 0
+    storage_name: str
 
     @abstractmethod
     async def get(self, key: str, default: Any = None) -> Any:
@@ -25,122 +514,1576 @@ class BaseStorage(ABC):
         """Must implement method to delete data"""
         pass
 
+    async def close(self) -> None:
+        """Release the resources held by the storage"""
+        pass
+
+    @classmethod
+    def open(cls, storage_name: str, **kwargs) -> 'BaseStorage':
+        """Get the instance of a storage shared across the process, creating it on first use
+
+        Every cog opening the same storage name in the same directory gets the same
+        data, lock and flusher. The other options are only used by the first call.
+        Each call must be balanced with a `release`, typically in `cog_unload`.
+        """
+        storage_dir = Path(kwargs.get('storage_dir') or Path(__file__).parent.parent.parent / 'data')
+        shared_key = (storage_dir.resolve(), storage_name.lower())
+        storage = BaseStorage._shared.get(shared_key)
+
+        if storage is None:
+            storage = cls(storage_name, **kwargs)
+            storage._shared_key = shared_key
+            BaseStorage._shared[shared_key] = storage
+        elif not isinstance(storage, cls):
+            raise TypeError(
+                f"Storage {storage_name} is already opened as {type(storage).__name__}, not {cls.__name__}"
+            )
+
+        storage._references += 1
+        return storage
+
+    async def release(self) -> None:
+        """Release a reference obtained with `open`, closing the storage after the last one"""
+        self._references -= 1
+        if self._references > 0:
+            return
+
+        if self._shared_key is not None and BaseStorage._shared.get(self._shared_key) is self:
+            del BaseStorage._shared[self._shared_key]
+        await self.close()
+
+    @classmethod
+    async def close_all(cls) -> None:
+        """Flush and close every opened storage"""
+        for storage in list(BaseStorage._instances):
+            await storage.close()
+
 class JSONStorage(BaseStorage):
-    """JSON file storage implementation"""
+    """JSON file storage implementation
+
+    With `write_behind` enabled, mutations only mark the storage as dirty and a
+    background task writes the file at most once every `flush_interval` seconds,
+    off the event loop.
+
+    `codec` is one of `CODECS`: compact `json` (default), `json-pretty` or `pickle`.
+    The format of an existing file is detected when loading it.
+
+    With `backup_interval` set, a compressed backup is written in the background
+    every `backup_interval` seconds once the data changed, see `BackupManager`.
+
+    With `multiprocess` enabled, several processes can share the file: writes hold
+    an advisory file lock, and if another process modified the file since it was
+    last read, its changes are merged first, keeping the keys changed locally.
+
+    Files live in the project's `data/` directory unless `storage_dir` is given.
+    """
     _data: Dict[str, Any]
     storage_name: str
+    supports_multiprocess: bool = True
+
+    def __init__(
+        self,
+        storage_name: str,
+        *,
+        codec: str = 'json',
+        write_behind: bool = False,
+        flush_interval: float = 5.0,
+        backup_interval: Optional[float] = None,
+        delta_backup_interval: Optional[float] = None,
+        max_backups: int = 10,
+        max_backup_age: Optional[float] = 30 * 24 * 3600,
+        multiprocess: bool = False,
+        storage_dir: Optional[Path] = None
+    ):
+        if multiprocess and not self.supports_multiprocess:
+            raise ValueError(f"{type(self).__name__} doesn't support multiprocess mode")
+        if multiprocess and fcntl is None:
+            raise ValueError("Multiprocess mode needs fcntl file locking, not available on this platform")
 
-    def __init__(self, storage_name: str):
         self.logger = logging.getLogger(f'{storage_name}Storage')
         self.storage_name = storage_name
+        self.codec = CODECS[codec]
         self._data = {}
-        self._lock = asyncio.Lock()
+        self._locks = _LockTable()
+        self._transaction: Optional[_Transaction] = None
+        # Tasks started inside a transaction inherit it with the context
+        self._transaction_context: ContextVar[Optional[_Transaction]] = ContextVar(
+            f'{storage_name}_transaction', default=None
+        )
+        self._subscriptions: List[Subscription] = []
+        self._notification_tasks: Set[asyncio.Task] = set()
+
+        # Write-behind state
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self._dirty = False
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
 
         # Get project root directory
         self.project_root = Path(__file__).parent.parent.parent
 
         # Set up storage paths
-        self.storage_dir = self.project_root / 'data'
+        self.storage_dir = Path(storage_dir) if storage_dir else self.project_root / 'data'
         self.backup_dir = self.storage_dir / 'backup'
-        self.file_path = self.storage_dir / f'{storage_name.lower()}.json'
+        self.file_path = self.storage_dir / f'{storage_name.lower()}{self.codec.extension}'
 
         # Create directories if they don't exists
         self.storage_dir.mkdir(exist_ok=True)
         self.backup_dir.mkdir(exist_ok=True)
 
+        # Multiprocess state
+        self.multiprocess = multiprocess
+        self._process_lock = _ProcessLock(self.file_path.with_suffix('.lock')) if multiprocess else None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._unsynced_keys: Set[str] = set()
+        self._unsynced_all = False
+
+        # Backups
+        self.backup_interval = backup_interval
+        self.delta_backup_interval = delta_backup_interval
+        self.backups = BackupManager(self, max_backups=max_backups, max_age=max_backup_age)
+
         # Load initial data
-        self._ensure_file_exists()
-        self._load_data()
+        if self.multiprocess:
+            with self._process_lock:
+                self._ensure_file_exists()
+                self._load_data()
+        else:
+            self._ensure_file_exists()
+            self._load_data()
+
+        BaseStorage._instances.add(self)
+
+    def _write_file(self, data: Dict[str, Any], file_path: Optional[Path] = None) -> None:
+        """Write data to a temporary file, fsync it and rename it over the storage file"""
+        file_path = file_path or self.file_path
+        tmp_path = file_path.with_name(f'{file_path.name}.{os.getpid()}.tmp')
+        payload = self.codec.dumps(data)
+        with open(tmp_path, 'wb') as file:
+            file.write(payload)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, file_path)
 
     def _save_data(self, data: Dict[str,  Any]) -> None:
-        """Save data to JSON file"""
+        """Save data to the storage file"""
         try:
-            with open(self.file_path, 'w', encoding='utf-8') as file:
-                json.dump(data, file, indent=2, ensure_ascii=False)
+            self._write_file(data)
         except Exception as error:
             self.logger.error(f"Error saving data: {error}")
 
-    def _create_backup(self) -> None:
-        """Create a backup for the current data file"""
-        if self.file_path.exists():
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            backup_path = self.backup_dir / f'{self.storage_name.lower()}_{timestamp}.json'
+    def _persist(self, keys: Optional[Iterable[str]] = None) -> None:
+        """Save the current data now, or schedule it when write-behind is enabled
+
+        `keys` are the top-level keys that changed, `None` meaning the whole storage.
+        In multiprocess mode the changes are written by `_sync`, which takes the
+        file lock away from the event loop.
+        """
+        if self.multiprocess:
+            if keys is None:
+                self._unsynced_all = True
+            else:
+                self._unsynced_keys.update(keys)
+
+        if self.write_behind:
+            self._schedule_flush()
+        elif self.multiprocess:
+            self._dirty = True
+        else:
+            self._save_data(self._data)
+
+    async def _sync(self) -> None:
+        """Write the committed changes before the lock is released, in multiprocess write-through mode"""
+        if self.multiprocess and not self.write_behind and self._dirty:
+            await self.flush()
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        """Cheap version stamp of the file, changed by any rewrite"""
+        try:
+            stat = self.file_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+    def _read_external(self) -> Optional[Dict[str, Any]]:
+        """Data written by another process since the file was last read or written here"""
+        if self._file_signature() == self._signature:
+            return None
+
+        payload = self.file_path.read_bytes()
+        data = detect_codec(payload).loads(payload)
+        self._signature = self._file_signature()
+        return data
+
+    def _merge_external(self, external: Dict[str, Any]) -> None:
+        """Take the keys changed by other processes, keeping the ones changed here"""
+        if self._unsynced_all:
+            return
+
+        changed_keys = set()
+        for key in list(self._data):
+            if key not in external and key not in self._unsynced_keys:
+                del self._data[key]
+                changed_keys.add(key)
+        for key, value in external.items():
+            if key not in self._unsynced_keys and self._data.get(key, _MISSING) != value:
+                self._data[key] = value
+                changed_keys.add(key)
+
+        if changed_keys:
+            self.logger.info(f"Merged {len(changed_keys)} keys changed by another process")
+            if self._subscriptions:
+                self._notify(StorageChange(self.storage_name, frozenset(changed_keys)))
+
+    def _mark_synced(self, keys: Set[str], everything: bool) -> None:
+        """Record that changes were written to the file"""
+        self._signature = self._file_signature()
+        self._unsynced_keys -= keys
+        if everything:
+            self._unsynced_all = False
+
+    async def _acquire_process_lock(self) -> None:
+        """Take the file lock in a worker thread, it is released again if the task is cancelled meanwhile"""
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self._process_lock.acquire))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            await acquiring
+            self._process_lock.release()
+            raise
+
+    async def refresh(self) -> None:
+        """Load the changes made by other processes, in multiprocess mode"""
+        if not self.multiprocess:
+            return
+
+        # Every user of the process lock holds the flush lock, the file lock is not reentrant
+        async with self._flush_lock:
+            await self._acquire_process_lock()
             try:
-                shutil.copy2(self.file_path, backup_path)
-                self.logger.info(f"Created backup: {backup_path}")
+                external = await asyncio.to_thread(self._read_external)
+                if external is not None:
+                    self._merge_external(external)
+            finally:
+                self._process_lock.release()
+
+    def _schedule_flush(self) -> None:
+        """Mark the storage as dirty and make sure the background flusher is running"""
+        self._dirty = True
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        """Flush pending changes every `flush_interval` seconds until nothing is left"""
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write pending changes to disk in a worker thread"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            if self.multiprocess:
+                await self._acquire_process_lock()
+            try:
+                if self.multiprocess:
+                    external = await asyncio.to_thread(self._read_external)
+                    if external is not None:
+                        self._merge_external(external)
+
+                # Values are replaced rather than mutated in place, a shallow copy is a stable snapshot
+                snapshot = dict(self._data)
+                synced_keys, synced_all = self._unsynced_keys.copy(), self._unsynced_all
+                self._dirty = False
+                await asyncio.to_thread(self._write_file, snapshot)
+                if self.multiprocess:
+                    self._mark_synced(synced_keys, synced_all)
             except Exception as error:
-                self.logger.error(f"Error creating backup: {error}")
+                self._dirty = True
+                self.logger.error(f"Error flushing data: {error}")
+            finally:
+                if self.multiprocess:
+                    self._process_lock.release()
+
+    async def close(self) -> None:
+        """Stop the background flusher and write any pending changes"""
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        self._flusher = None
+        self.backups.cancel()
+        await self.flush()
+
+    def _create_backup(self) -> None:
+        """Create a compressed backup of the data
+
+        The file is backed up as is, unless changes are still waiting to be written to it.
+        """
+        try:
+            if self._dirty or self._flush_lock.locked():
+                backup_path = self.backups.snapshot(dict(self._data))
+            else:
+                backup_path = self.backups.backup_file()
+            if backup_path:
+                self.logger.info(f"Created backup: {backup_path}")
+        except Exception as error:
+            self.logger.error(f"Error creating backup: {error}")
+
+    async def restore_backup(self, backup_path: Optional[Path] = None) -> None:
+        """Replace the data with the one of a backup, the most recent one by default"""
+        data = await asyncio.to_thread(self.backups.load, backup_path)
+        async with self._locked() as transaction:
+            transaction.clear()
+            self._data = data
+        self.logger.info(f"Restored backup: {backup_path or 'latest'}")
 
     def _ensure_file_exists(self) -> None:
-        """Ensure the JSON file exists with valid initial data"""
-        if not self.file_path.exists():
-            self._save_data({})
+        """Ensure the storage file exists with valid initial data
+
+        A file written with another codec is converted and moved to the backups.
+        """
+        if self.file_path.exists():
+            return
+
+        for codec in CODECS.values():
+            previous_path = self.file_path.with_suffix(codec.extension)
+            if previous_path != self.file_path and previous_path.exists():
+                try:
+                    convert_storage_file(previous_path, self.codec.name, self.file_path)
+                    shutil.move(previous_path, self.backup_dir / previous_path.name)
+                    self.logger.info(f"Converted {previous_path} to {self.codec.name}")
+                    return
+                except Exception as error:
+                    self.logger.error(f"Error converting {previous_path}: {error}")
+
+        self._save_data({})
 
     def _load_data(self) -> None:
-        """Load data from JSON file"""
+        """Load data from the storage file"""
         try:
-            with open(self.file_path, 'r', encoding='utf-8') as file:
-                self._data = json.load(file)
-        except json.JSONDecodeError:
-            self.logger.error(f"Corrupted JSON file: {self.file_path}")
+            signature = self._file_signature()
+            payload = self.file_path.read_bytes()
+            self._data = detect_codec(payload).loads(payload)
+            self._signature = signature
+        except (ValueError, pickle.UnpicklingError, EOFError):
+            self.logger.error(f"Corrupted storage file: {self.file_path}")
             self._create_backup()
             self._data = {}
             self._save_data(self._data)
+            self._signature = self._file_signature()
         except Exception as error:
             self.logger.error(f"Error loading data: {error}")
             self._data = {}
 
+    @asynccontextmanager
+    async def _locked(self, key: Optional[str] = None) -> AsyncIterator['_Transaction']:
+        """Hold the lock of a key, or of the whole storage, and save the changes once released
+
+        Inside a running transaction of the current task, or of the task that started
+        it, its lock and changes are reused.
+        """
+        if self._in_transaction():
+            yield self._transaction
+            return
+
+        async with (self._locks.key(key) if key is not None else self._locks.exclusive()):
+            transaction = _Transaction(self)
+            yield transaction
+            self._commit(transaction)
+            await self._sync()
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator['JSONStorage']:
+        """Apply several mutations under a single lock and save them once
+
+        The changes are rolled back if the block raises. Readers don't take any lock,
+        so they see the changes before the commit. Tasks started inside the block,
+        e.g. by `asyncio.gather`, take part in the transaction.
+
+        Example
+        -------
+        async with storage.transaction():
+            await storage.set('first', 1)
+            await storage.delete('second')
+        """
+        if self._in_transaction():
+            yield self
+            return
+
+        async with self._locks.exclusive():
+            transaction = _Transaction(self, rollback=True)
+            self._transaction = transaction
+            token = self._transaction_context.set(transaction)
+            try:
+                yield self
+            except BaseException:
+                transaction.rollback()
+                raise
+            else:
+                self._commit(transaction)
+                await self._sync()
+            finally:
+                self._transaction = None
+                self._transaction_context.reset(token)
+
+    def _in_transaction(self) -> bool:
+        """Whether the current task runs inside the running transaction"""
+        return self._transaction is not None and self._transaction_context.get() is self._transaction
+
+    def _commit(self, transaction: '_Transaction') -> None:
+        """Save the changes of a transaction"""
+        if not transaction.cleared and not transaction.keys:
+            return
+
+        keys = None if transaction.cleared else transaction.keys
+        self._persist(keys)
+        self.backups.track(keys)
+        if self.backup_interval:
+            self.backups.schedule(self.backup_interval, self.delta_backup_interval)
+
+        if self._subscriptions:
+            self._notify(StorageChange(self.storage_name, frozenset(transaction.keys), transaction.cleared))
+
+    def _notify(self, change: StorageChange) -> None:
+        """Call the subscriptions interested in a change, coroutines are scheduled as tasks"""
+        for subscription in list(self._subscriptions):
+            matched_change = subscription.matches(change)
+            if matched_change is None:
+                continue
+
+            try:
+                result = subscription.callback(matched_change)
+                if inspect.isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._notification_tasks.add(task)
+                    task.add_done_callback(self._on_notification_done)
+            except Exception as error:
+                self.logger.error(f"Error in storage subscription {subscription.callback!r}: {error}", exc_info=True)
+
+    def _on_notification_done(self, task: asyncio.Task) -> None:
+        self._notification_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            self.logger.error(f"Error in storage subscription: {error}", exc_info=error)
+
+    def subscribe(
+        self,
+        callback: Callable[[StorageChange], Union[None, Awaitable[None]]],
+        *keys: str
+    ) -> Subscription:
+        """Call `callback` after each commit changing one of `keys`, or any key if none given
+
+        The callback can be a coroutine function, and receives a `StorageChange`
+        with the matching keys. A transaction triggers a single call.
+        """
+        subscription = Subscription(self, callback, frozenset(keys) if keys else None)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    async def watch(self, *keys: str) -> AsyncIterator[StorageChange]:
+        """Iterate over the changes of `keys`, or of any key if none given
+
+        Example
+        -------
+        async for change in storage.watch('prefixes'):
+            self.cache.clear()
+        """
+        queue: asyncio.Queue[StorageChange] = asyncio.Queue()
+        subscription = self.subscribe(queue.put_nowait, *keys)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            subscription.cancel()
+
     async def get(self, key: str, default: Any = None) -> Any:
         """Get value from storage"""
-        async with self._lock:
-            return self._data.get(key, default)
+        return self._data.get(key, default)
         
     async def set(self, key: str, value: Any) -> None:
         """Set value in storage"""
-        async with self._lock:
+        async with self._locked(key) as transaction:
+            transaction.touch(key)
             self._data[key] = value
-            self._save_data(self._data)
+
+    async def set_many(self, values: Mapping[str, Any]) -> None:
+        """Set several values in storage, saved at once"""
+        async with self._locked() as transaction:
+            for key, value in values.items():
+                transaction.touch(key)
+                self._data[key] = value
 
     async def delete(self, key: str) -> bool:
         """Delete value from storage"""
-        async with self._lock:
+        async with self._locked(key) as transaction:
             if key in self._data:
+                transaction.touch(key)
                 del self._data[key]
-                self._save_data(self._data)
                 return True
             return False
+
+    async def delete_many(self, keys: Iterable[str]) -> int:
+        """Delete several values from storage, saved at once
+
+        Returns the number of deleted keys.
+        """
+        deleted = 0
+        async with self._locked() as transaction:
+            for key in keys:
+                if key in self._data:
+                    transaction.touch(key)
+                    del self._data[key]
+                    deleted += 1
+        return deleted
         
     async def clear(self) -> None:
         """Clear all data from storage"""
-        async with self._lock:
+        async with self._locked() as transaction:
+            transaction.clear()
             self._create_backup()
             self._data = {}
-            self._save_data(self._data)
 
-    async def get_all(self) -> Dict[str, Any]:
-        """Get all stored data"""
-        async with self._lock:
-            return self._data.copy()
-        
+    async def get_all(self) -> Mapping[str, Any]:
+        """Get a read-only view of all stored data
+
+        The view is not a copy, it reflects the changes made afterwards, including
+        the data replaced by `clear` and `restore_backup`.
+        """
+        return _DataView(self)
+
+class _Transaction:
+    """Changes made to a storage while its lock is held"""
+
+    def __init__(self, storage: JSONStorage, rollback: bool = False):
+        self.storage = storage
+        self.keys: Set[str] = set()
+        self.cleared = False
+        self._rollback = rollback
+        self._previous_values: Dict[str, Any] = {}
+        self._previous_data: Optional[Dict[str, Any]] = None
+
+    def touch(self, key: str) -> None:
+        """Record that a key is about to change"""
+        self.keys.add(key)
+        if self._rollback and self._previous_data is None and key not in self._previous_values:
+            self._previous_values[key] = self.storage._data.get(key, _MISSING)
+
+    def clear(self) -> None:
+        """Record that the whole storage is about to be cleared"""
+        self.cleared = True
+        if self._rollback and self._previous_data is None:
+            self._previous_data = dict(self.storage._data)
+
+    def rollback(self) -> None:
+        """Restore the data as it was before the transaction"""
+        if self._previous_data is not None:
+            self.storage._data = self._previous_data
+
+        for key, value in self._previous_values.items():
+            if value is _MISSING:
+                self.storage._data.pop(key, None)
+            else:
+                self.storage._data[key] = value
+
+class _LockTable:
+    """Per-key locks which can also be held all at once
+
+    Writers of different keys don't wait for each other, while an exclusive
+    holder waits for every key to be released and blocks new key holders.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._keys: Set[str] = set()
+        self._exclusive = False
+        self._exclusive_waiters = 0
+
+    @asynccontextmanager
+    async def key(self, key: str) -> AsyncIterator[None]:
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._exclusive and not self._exclusive_waiters and key not in self._keys
+            )
+            self._keys.add(key)
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._keys.discard(key)
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def exclusive(self) -> AsyncIterator[None]:
+        async with self._condition:
+            self._exclusive_waiters += 1
+            try:
+                await self._condition.wait_for(lambda: not self._exclusive and not self._keys)
+            finally:
+                self._exclusive_waiters -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._exclusive = False
+                self._condition.notify_all()
+
 class GuildStorage(JSONStorage):
-    """Specialized storage for guild-specific data"""
+    """Specialized storage for guild-specific data
+
+    Reads don't take any lock, guild data is replaced rather than mutated in place
+    so the returned mappings are stable snapshots. Writers only lock their guild.
+
+    With a `schema`, a dataclass (ideally with `slots=True`) whose fields all have
+    defaults, guild data is validated on write and only the values differing from
+    the defaults are kept. `get_guild_settings` hydrates them into a record.
+
+    Example
+    -------
+    @dataclass(slots=True)
+    class Settings:
+        prefix: str = '!'
+        welcome_channel: Optional[int] = None
 
-    async def get_guild_data(self, guild_id: int) -> Dict[str, Any]:
-        """Get all data for specific guild"""
-        async with self._lock:
-            return self._data.get(str(guild_id), {})
+    storage = GuildStorage('Settings', schema=Settings)
+    """
+
+    def __init__(self, storage_name: str, *, schema: Optional[type] = None, **kwargs):
+        self.schema = _Schema(schema) if schema is not None else None
+        super().__init__(storage_name, **kwargs)
+
+    async def get_guild_settings(self, guild_id: int) -> Any:
+        """Get the settings record of a guild, defaults included"""
+        if self.schema is None:
+            raise TypeError(f"{self.storage_name} storage has no schema")
+        return self.schema.hydrate(await self.get_guild_data(guild_id))
+
+    async def save_guild_settings(self, guild_id: int, settings: Any) -> None:
+        """Save a settings record of a guild"""
+        if self.schema is None:
+            raise TypeError(f"{self.storage_name} storage has no schema")
+        await self.update_guild_data(guild_id, self.schema.dehydrate(settings))
+
+    async def get_guild_data(self, guild_id: int) -> Mapping[str, Any]:
+        """Get a read-only snapshot of all data for specific guild"""
+        return MappingProxyType(self._data.get(str(guild_id), {}))
         
     async def set_guild_data(self, guild_id: int, key: str, value: Any) -> None:
         """Set data for specific guild"""
-        async with self._lock:
-            guild_data = self._data.get(str(guild_id), {})
-            guild_data[key] = value
-            self._data[str(guild_id)] = guild_data
-            self._save_data(self._data)
+        await self.update_guild_data(guild_id, {key: value})
+
+    async def update_guild_data(self, guild_id: int, values: Mapping[str, Any]) -> None:
+        """Set several data for specific guild, saved at once"""
+        if self.schema is not None:
+            self.schema.validate(values)
+
+        async with self._locked(str(guild_id)) as transaction:
+            transaction.touch(str(guild_id))
+            self._store_guild_data(str(guild_id), {**self._data.get(str(guild_id), {}), **values})
+
+    async def set(self, key: str, value: Any) -> None:
+        """Set all data of a guild, validated against the schema if any"""
+        if self.schema is None:
+            return await super().set(key, value)
+
+        self._validate_guild_data(value)
+        async with self._locked(key) as transaction:
+            transaction.touch(key)
+            self._store_guild_data(key, value)
+
+    async def set_many(self, values: Mapping[str, Any]) -> None:
+        """Set all data of several guilds, saved at once"""
+        if self.schema is None:
+            return await super().set_many(values)
+
+        for value in values.values():
+            self._validate_guild_data(value)
+        async with self._locked() as transaction:
+            for key, value in values.items():
+                transaction.touch(key)
+                self._store_guild_data(key, value)
+
+    def _validate_guild_data(self, guild_data: Any) -> None:
+        if not isinstance(guild_data, Mapping):
+            raise SchemaError(f"Guild data must be a mapping, not {type(guild_data).__name__}")
+        self.schema.validate(guild_data)
+
+    def _store_guild_data(self, key: str, guild_data: Dict[str, Any]) -> None:
+        """Replace the data of a guild, only keeping what differs from the schema defaults"""
+        if self.schema is not None:
+            guild_data = {
+                field: value for field, value in guild_data.items()
+                if field not in self.schema.defaults or value != self.schema.defaults[field]
+            }
+            if not guild_data:
+                self._data.pop(key, None)
+                return
+
+        self._data[key] = guild_data
 
     async def delete_guild_data(self, guild_id: int) -> None:
         """Delete all data for specific guild"""
-        async with self._lock:
+        async with self._locked(str(guild_id)) as transaction:
             if str(guild_id) in self._data:
+                transaction.touch(str(guild_id))
                 del self._data[str(guild_id)]
-                self._save_data(self._data)
\ No newline at end of file
+
+    def subscribe_guild(
+        self,
+        guild_id: int,
+        callback: Callable[[StorageChange], Union[None, Awaitable[None]]]
+    ) -> Subscription:
+        """Call `callback` after each commit changing the data of a guild"""
+        return self.subscribe(callback, str(guild_id))
+
+    def watch_guild(self, guild_id: int) -> AsyncIterator[StorageChange]:
+        """Iterate over the changes of the data of a guild"""
+        return self.watch(str(guild_id))
+
+    async def increment(
+        self,
+        guild_id: int,
+        *path: Union[str, int],
+        amount: Union[int, float] = 1,
+        minimum: Optional[Union[int, float]] = 0,
+        maximum: Optional[Union[int, float]] = None
+    ) -> Union[int, float]:
+        """Add to a numeric field of a guild and return its new value
+
+        `path` leads to the field through nested data, a missing field counts as 0.
+        Raises `BoundsError` if the result is out of `minimum` / `maximum`.
+
+        Example
+        -------
+        await storage.increment(guild.id, 'balances', member.id, amount=50)
+        """
+        return await self._update_number(guild_id, path, lambda value: value + amount, minimum, maximum)
+
+    async def decrement(
+        self,
+        guild_id: int,
+        *path: Union[str, int],
+        amount: Union[int, float] = 1,
+        minimum: Optional[Union[int, float]] = 0,
+        maximum: Optional[Union[int, float]] = None
+    ) -> Union[int, float]:
+        """Subtract from a numeric field of a guild and return its new value
+
+        By default the value can't go below 0, see `increment`.
+        """
+        return await self._update_number(guild_id, path, lambda value: value - amount, minimum, maximum)
+
+    async def apply(
+        self,
+        guild_id: int,
+        *path: Union[str, int],
+        operation: SetParser,
+        minimum: Optional[Union[int, float]] = 0,
+        maximum: Optional[Union[int, float]] = None
+    ) -> Union[int, float]:
+        """Apply a parsed `deposit`, `withdraw` or `set` operation to a numeric field of a guild"""
+        updates = {
+            'deposit': lambda value: value + operation.sum,
+            'withdraw': lambda value: value - operation.sum,
+            'set': lambda value: operation.sum,
+        }
+        return await self._update_number(guild_id, path, updates[operation.operation], minimum, maximum)
+
+    async def _update_number(
+        self,
+        guild_id: int,
+        path: Sequence[Union[str, int]],
+        update: Callable[[Union[int, float]], Union[int, float]],
+        minimum: Optional[Union[int, float]],
+        maximum: Optional[Union[int, float]]
+    ) -> Union[int, float]:
+        """Update a nested numeric field, copying only the containers along its path"""
+        if not path:
+            raise ValueError("A path to the numeric field is required")
+        keys = [str(key) for key in path]
+
+        async with self._locked(str(guild_id)) as transaction:
+            containers = [self._data.get(str(guild_id), {})]
+            for key in keys[:-1]:
+                container = containers[-1].get(key, {})
+                if not isinstance(container, dict):
+                    raise TypeError(f"{key} is not a mapping in guild {guild_id}")
+                containers.append(container)
+
+            current = containers[-1].get(keys[-1], 0)
+            if isinstance(current, bool) or not isinstance(current, (int, float)):
+                raise TypeError(f"{'.'.join(keys)} is not a number in guild {guild_id}")
+
+            value = update(current)
+            if minimum is not None and value < minimum:
+                raise BoundsError(f"{'.'.join(keys)} can't go below {minimum} (would be {value})")
+            if maximum is not None and value > maximum:
+                raise BoundsError(f"{'.'.join(keys)} can't go above {maximum} (would be {value})")
+
+            new_data = value
+            for container, key in zip(reversed(containers), reversed(keys)):
+                new_data = {**container, key: new_data}
+
+            if self.schema is not None:
+                self.schema.validate({keys[0]: new_data[keys[0]]})
+
+            transaction.touch(str(guild_id))
+            self._store_guild_data(str(guild_id), new_data)
+
+        return value
+
+class JournalStorage(JSONStorage):
+    """Append-only journal storage implementation
+
+    Every mutation appends one compact record to `<name>.journal` instead of
+    rewriting the whole file. The JSON file is a snapshot that is rewritten in a
+    worker thread once the journal grows past `compact_threshold` bytes.
+    The snapshot plus the journal replay rebuild the data at startup.
+
+    Appending a record is cheap, so `write_behind` has no effect on this storage.
+    """
+    supports_multiprocess = False
+
+    def __init__(self, storage_name: str, *, compact_threshold: int = 1024 * 1024, **kwargs):
+        self.compact_threshold = compact_threshold
+        self._journal = None
+        self._compaction: Optional[asyncio.Task] = None
+        self._loaded = False
+        super().__init__(storage_name, **kwargs)
+
+    @property
+    def journal_path(self) -> Path:
+        return self.file_path.with_suffix('.journal')
+
+    @property
+    def old_journal_path(self) -> Path:
+        """Journal being folded into the snapshot by a running compaction"""
+        return self.file_path.with_suffix('.journal.old')
+
+    def _load_data(self) -> None:
+        """Load the snapshot then replay the journals on top of it"""
+        super()._load_data()
+        for journal_path in (self.old_journal_path, self.journal_path):
+            if journal_path.exists():
+                self._replay(journal_path)
+        self._loaded = True
+
+    def _replay(self, journal_path: Path) -> None:
+        """Apply every record of a journal file to the data"""
+        with open(journal_path, 'rb') as file:
+            for line_number, line in enumerate(file, start=1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn write can only happen on the last record
+                    self.logger.warning(f"Ignoring corrupted record {line_number} of {journal_path}")
+                    break
+
+                operation = record[0]
+                if operation == 's':
+                    self._data[record[1]] = record[2]
+                elif operation == 'd':
+                    self._data.pop(record[1], None)
+                elif operation == 'c':
+                    self._data = {}
+
+    def _append(self, records: Iterable[list]) -> None:
+        """Append records to the journal"""
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'ab')
+
+        payload = ''.join(
+            json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n'
+            for record in records
+        )
+        self._journal.write(payload.encode('utf-8'))
+        self._journal.flush()
+
+    def _persist(self, keys: Optional[Iterable[str]] = None) -> None:
+        """Append one record per changed key"""
+        if keys is None:
+            records = [['c']] + [['s', key, value] for key, value in self._data.items()]
+        else:
+            records = [
+                ['s', key, self._data[key]] if key in self._data else ['d', key]
+                for key in keys
+            ]
+
+        try:
+            self._append(records)
+        except Exception as error:
+            self.logger.error(f"Error appending to journal: {error}")
+            return
+
+        if self._journal.tell() >= self.compact_threshold:
+            self._start_compaction()
+
+    def _rotate_journal(self) -> None:
+        """Move the current journal aside so new records go to a fresh one"""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+        if not self.old_journal_path.exists():
+            self.journal_path.rename(self.old_journal_path)
+            return
+
+        # A previous compaction failed, keep the records in order
+        with open(self.old_journal_path, 'ab') as old_journal:
+            old_journal.write(self.journal_path.read_bytes())
+        self.journal_path.unlink()
+
+    def _start_compaction(self) -> None:
+        if self._compaction is not None and not self._compaction.done():
+            return
+
+        self._rotate_journal()
+        self._compaction = asyncio.get_running_loop().create_task(self._compact(dict(self._data)))
+
+    async def _compact(self, snapshot: Dict[str, Any]) -> None:
+        """Write the snapshot and drop the journal it replaces"""
+        try:
+            await asyncio.to_thread(self._write_file, snapshot)
+            self.old_journal_path.unlink(missing_ok=True)
+        except Exception as error:
+            self.logger.error(f"Error compacting journal: {error}")
+
+    def _create_backup(self) -> None:
+        """Create a compressed backup of the data, the snapshot file misses the journal records
+
+        While loading, the data is not there yet and the snapshot file is backed up as is.
+        """
+        if not self._loaded:
+            super()._create_backup()
+            return
+
+        try:
+            backup_path = self.backups.snapshot(dict(self._data))
+            self.logger.info(f"Created backup: {backup_path}")
+        except Exception as error:
+            self.logger.error(f"Error creating backup: {error}")
+
+    async def close(self) -> None:
+        """Wait for a running compaction and close the journal"""
+        if self._compaction is not None:
+            await self._compaction
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        await super().close()
+
+class JournalGuildStorage(GuildStorage, JournalStorage):
+    """Guild-specific data stored in an append-only journal"""
+
+class ShardedGuildStorage(GuildStorage):
+    """Guild storage split in one file per guild under `data/<name>/`
+
+    With `buckets` set, guilds are grouped in that many files by their ID instead.
+    Shards are loaded the first time one of their guilds is accessed, and shards
+    not accessed for `idle_timeout` seconds are evicted from memory.
+    """
+    supports_multiprocess = False
+
+    def __init__(
+        self,
+        storage_name: str,
+        *,
+        buckets: Optional[int] = None,
+        idle_timeout: float = 600.0,
+        **kwargs
+    ):
+        self.buckets = buckets
+        self.idle_timeout = idle_timeout
+        self._loaded_shards: Dict[str, float] = {}  # shard -> last access
+        self._shard_keys: Dict[str, Set[str]] = {}  # shard -> loaded keys
+        self._dirty_shards: set = set()
+        self._last_eviction = time.monotonic()
+        if kwargs.get('backup_interval'):
+            raise ValueError("Scheduled backups need the whole data in memory, which sharded storage doesn't keep")
+        super().__init__(storage_name, **kwargs)
+
+    @property
+    def shard_dir(self) -> Path:
+        return self.storage_dir / self.storage_name.lower()
+
+    def _ensure_file_exists(self) -> None:
+        """Ensure the shards directory exists"""
+        self.shard_dir.mkdir(exist_ok=True)
+
+    def _load_data(self) -> None:
+        """Shards are loaded lazily"""
+        self._data = {}
+
+    def _shard_of(self, key: str) -> str:
+        if self.buckets:
+            index = int(key) if key.isdigit() else zlib.crc32(key.encode('utf-8'))
+            return f'bucket_{index % self.buckets}'
+        if key.isdigit():
+            return key
+        return f'key_{zlib.crc32(key.encode("utf-8")):08x}'
+
+    def _shard_path(self, shard: str) -> Path:
+        return self.shard_dir / f'{shard}{self.codec.extension}'
+
+    def _read_shard(self, shard: str) -> Dict[str, Any]:
+        shard_path = self._shard_path(shard)
+        if not shard_path.exists():
+            return {}
+        try:
+            payload = shard_path.read_bytes()
+            return detect_codec(payload).loads(payload)
+        except (ValueError, pickle.UnpicklingError, EOFError):
+            self.logger.error(f"Corrupted storage file: {shard_path}")
+            return {}
+
+    def _shard_data(self, shard: str) -> Dict[str, Any]:
+        """Loaded data belonging to a shard"""
+        return {key: self._data[key] for key in self._shard_keys.get(shard, ()) if key in self._data}
+
+    def _index_keys(self, keys: Iterable[str]) -> None:
+        """Update the shard of changed or loaded keys in the index"""
+        for key in keys:
+            if key in self._data:
+                self._shard_keys.setdefault(self._shard_of(key), set()).add(key)
+            else:
+                self._shard_keys.get(self._shard_of(key), set()).discard(key)
+
+    def _write_shard(self, shard: str, data: Dict[str, Any]) -> None:
+        if data:
+            self._write_file(data, self._shard_path(shard))
+        else:
+            self._shard_path(shard).unlink(missing_ok=True)
+
+    async def _ensure_loaded(self, key: str) -> None:
+        """Load the shard holding a key if needed and mark it as accessed"""
+        shard = self._shard_of(key)
+        if shard not in self._loaded_shards:
+            data = await asyncio.to_thread(self._read_shard, shard)
+            # Another task may have loaded it while reading
+            if shard not in self._loaded_shards:
+                self._data.update(data)
+                self._index_keys(data)
+
+        self._loaded_shards[shard] = time.monotonic()
+        self._evict_cold_shards()
+
+    def _evict_cold_shards(self) -> None:
+        """Drop shards not accessed for `idle_timeout` seconds and without pending writes"""
+        now = time.monotonic()
+        if now - self._last_eviction < self.idle_timeout:
+            return
+        self._last_eviction = now
+
+        cold_shards = {
+            shard for shard, last_access in self._loaded_shards.items()
+            if now - last_access >= self.idle_timeout and shard not in self._dirty_shards
+        }
+        if not cold_shards:
+            return
+
+        for shard in cold_shards:
+            del self._loaded_shards[shard]
+            for key in self._shard_keys.pop(shard, ()):
+                self._data.pop(key, None)
+        self.logger.debug(f"Evicted {len(cold_shards)} cold shards")
+
+    async def _load_all_shards(self) -> None:
+        for shard_path in self.shard_dir.glob(f'*{self.codec.extension}'):
+            shard = shard_path.stem
+            if shard not in self._loaded_shards:
+                data = await asyncio.to_thread(self._read_shard, shard)
+                if shard not in self._loaded_shards:
+                    self._data.update(data)
+                    self._index_keys(data)
+                    self._loaded_shards[shard] = time.monotonic()
+
+    def _persist(self, keys: Optional[Iterable[str]] = None) -> None:
+        """Save the shards holding the changed keys"""
+        if keys is None:
+            self._shard_keys = {}
+            self._index_keys(self._data)
+            shards = set(self._loaded_shards) | {path.stem for path in self.shard_dir.glob(f'*{self.codec.extension}')}
+        else:
+            keys = set(keys)
+            self._index_keys(keys)
+            shards = {self._shard_of(key) for key in keys}
+
+        if self.write_behind:
+            self._dirty_shards.update(shards)
+            self._schedule_flush()
+            return
+
+        for shard in shards:
+            try:
+                self._write_shard(shard, self._shard_data(shard))
+            except Exception as error:
+                self.logger.error(f"Error saving shard {shard}: {error}")
+
+    async def flush(self) -> None:
+        """Write the pending shards to disk in a worker thread"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            snapshots = {shard: self._shard_data(shard) for shard in self._dirty_shards}
+            self._dirty_shards = set()
+            self._dirty = False
+            for shard, data in snapshots.items():
+                try:
+                    await asyncio.to_thread(self._write_shard, shard, data)
+                except Exception as error:
+                    self._dirty_shards.add(shard)
+                    self._dirty = True
+                    self.logger.error(f"Error flushing shard {shard}: {error}")
+
+    def _create_backup(self) -> None:
+        """Create a compressed archive of the shards directory, with the shards not written yet"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        root_dir = self.shard_dir
+        try:
+            if self._dirty or self._flush_lock.locked():
+                # The loaded shards are archived as they are in memory
+                root_dir = self.shard_dir.with_name(f'.{self.shard_dir.name}_backup')
+                shutil.rmtree(root_dir, ignore_errors=True)
+                shutil.copytree(self.shard_dir, root_dir, ignore=shutil.ignore_patterns('*.tmp'))
+                for shard in self._loaded_shards:
+                    data = self._shard_data(shard)
+                    shard_path = root_dir / self._shard_path(shard).name
+                    if data:
+                        shard_path.write_bytes(self.codec.dumps(data))
+                    else:
+                        shard_path.unlink(missing_ok=True)
+
+            backup_path = shutil.make_archive(
+                str(self.backup_dir / f'{self.backups.prefix}{timestamp}'), 'gztar', root_dir
+            )
+            self.logger.info(f"Created backup: {backup_path}")
+            self.backups.rotate()
+        except Exception as error:
+            self.logger.error(f"Error creating backup: {error}")
+        finally:
+            if root_dir != self.shard_dir:
+                shutil.rmtree(root_dir, ignore_errors=True)
+
+    def _extract_backup(self, backup_path: Path) -> None:
+        """Swap the shards directory with the content of an archive"""
+        extract_dir = self.shard_dir.with_name(f'.{self.shard_dir.name}_restore')
+        old_dir = self.shard_dir.with_name(f'.{self.shard_dir.name}_old')
+        for directory in (extract_dir, old_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+
+        try:
+            shutil.unpack_archive(str(backup_path), str(extract_dir), 'gztar')
+            self.shard_dir.rename(old_dir)
+            try:
+                extract_dir.rename(self.shard_dir)
+            except OSError:
+                old_dir.rename(self.shard_dir)
+                raise
+        finally:
+            shutil.rmtree(extract_dir, ignore_errors=True)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    async def restore_backup(self, backup_path: Optional[Path] = None) -> None:
+        """Replace the shards with the ones of an archive, the most recent one by default"""
+        if backup_path is None:
+            archives = [path for path in self.backups.list_backups() if path.name.endswith('.tar.gz')]
+            if not archives:
+                raise FileNotFoundError(f"No backup found for {self.storage_name}")
+            backup_path = archives[-1]
+
+        # Nothing is persisted here, the restored shards are already on disk
+        async with self._flush_lock, self._locks.exclusive():
+            await asyncio.to_thread(self._extract_backup, backup_path)
+            self._data = {}
+            self._loaded_shards = {}
+            self._shard_keys = {}
+            self._dirty_shards = set()
+            self._dirty = False
+
+        self.backups.track(None)
+        if self._subscriptions:
+            self._notify(StorageChange(self.storage_name, frozenset(), True))
+        self.logger.info(f"Restored backup: {backup_path}")
+
+    async def get(self, key: str, default: Any = None) -> Any:
+        """Get value from storage"""
+        await self._ensure_loaded(key)
+        return await super().get(key, default)
+
+    async def set(self, key: str, value: Any) -> None:
+        """Set value in storage"""
+        await self._ensure_loaded(key)
+        await super().set(key, value)
+
+    async def delete(self, key: str) -> bool:
+        """Delete value from storage"""
+        await self._ensure_loaded(key)
+        return await super().delete(key)
+
+    async def set_many(self, values: Mapping[str, Any]) -> None:
+        """Set several values in storage, saved at once"""
+        for key in values:
+            await self._ensure_loaded(key)
+        await super().set_many(values)
+
+    async def delete_many(self, keys: Iterable[str]) -> int:
+        """Delete several values from storage, saved at once"""
+        keys = list(keys)
+        for key in keys:
+            await self._ensure_loaded(key)
+        return await super().delete_many(keys)
+
+    async def get_all(self) -> Mapping[str, Any]:
+        """Get a read-only view of all stored data, loading every shard"""
+        await self._load_all_shards()
+        return await super().get_all()
+
+    async def get_guild_data(self, guild_id: int) -> Mapping[str, Any]:
+        """Get a read-only snapshot of all data for specific guild"""
+        await self._ensure_loaded(str(guild_id))
+        return await super().get_guild_data(guild_id)
+
+    async def update_guild_data(self, guild_id: int, values: Mapping[str, Any]) -> None:
+        """Set several data for specific guild, saved at once"""
+        await self._ensure_loaded(str(guild_id))
+        await super().update_guild_data(guild_id, values)
+
+    async def delete_guild_data(self, guild_id: int) -> None:
+        """Delete all data for specific guild"""
+        await self._ensure_loaded(str(guild_id))
+        await super().delete_guild_data(guild_id)
+
+    async def _update_number(self, guild_id: int, *args: Any) -> Union[int, float]:
+        await self._ensure_loaded(str(guild_id))
+        return await super()._update_number(guild_id, *args)
+
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+
+def index_json_object(payload: bytes) -> Dict[str, Tuple[int, int]]:
+    """Map each top-level key of a JSON object to the byte span of its value
+
+    Raises `ValueError` on malformed input.
+    """
+    text = payload.decode('utf-8')
+    scan_once = json.scanner.make_scanner(json.JSONDecoder())
+    ascii_only = len(text) == len(payload)
+
+    # Characters to bytes offsets conversion, only needed for non ASCII files
+    char_cursor = byte_cursor = 0
+    def byte_offset(char_offset: int) -> int:
+        nonlocal char_cursor, byte_cursor
+        if ascii_only:
+            return char_offset
+        byte_cursor += len(text[char_cursor:char_offset].encode('utf-8'))
+        char_cursor = char_offset
+        return byte_cursor
+
+    def skip_whitespace(position: int) -> int:
+        return _WHITESPACE_RE.match(text, position).end()
+
+    def expect(position: int, token: str) -> int:
+        if text[position:position + 1] != token:
+            raise ValueError(f"Expected {token!r} at character {position}")
+        return position + 1
+
+    def scan(position: int) -> Tuple[Any, int]:
+        try:
+            return scan_once(text, position)
+        except StopIteration:
+            raise ValueError(f"Expected a value at character {position}") from None
+
+    spans: Dict[str, Tuple[int, int]] = {}
+    position = skip_whitespace(expect(skip_whitespace(0), '{'))
+    if text[position:position + 1] == '}':
+        return spans
+
+    while True:
+        if text[position:position + 1] != '"':
+            raise ValueError(f"Expected a key at character {position}")
+        key, position = scan(position)
+
+        position = skip_whitespace(expect(skip_whitespace(position), ':'))
+        _, end = scan(position)
+        spans[key] = (byte_offset(position), byte_offset(end))
+
+        position = skip_whitespace(end)
+        if text[position:position + 1] == '}':
+            return spans
+        position = skip_whitespace(expect(position, ','))
+
+class _LazyData(MutableMapping):
+    """Top-level data of a JSON file decoded key by key on demand
+
+    Unchanged values are read from a memory map through their byte span and kept
+    in a LRU cache, changed values are kept in an overlay until the next save.
+    """
+
+    def __init__(self, buffer: Union[bytes, mmap.mmap], spans: Dict[str, Tuple[int, int]], cache_size: int):
+        self.buffer = buffer
+        self.spans = spans
+        self.cache_size = cache_size
+        self.changed: Dict[str, Any] = {}
+        self.deleted: Set[str] = set()
+        # Keys changed since the last call to `entries`
+        self.touched: Set[str] = set()
+        self._cache: 'OrderedDict[str, Any]' = OrderedDict()
+
+    def raw(self, key: str) -> Optional[bytes]:
+        """Encoded value of an unchanged key"""
+        if key in self.changed or key in self.deleted or key not in self.spans:
+            return None
+        start, end = self.spans[key]
+        return self.buffer[start:end]
+
+    def entries(self) -> List[Tuple[str, Optional[Tuple[int, int]], Any]]:
+        """Key, byte span of the unchanged values or value of the changed ones, of every key"""
+        self.touched = set()
+        return [
+            (key, None, self.changed[key]) if key in self.changed else (key, self.spans[key], None)
+            for key in self
+        ]
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.changed:
+            return self.changed[key]
+        if key in self.deleted or key not in self.spans:
+            raise KeyError(key)
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        value = json.loads(self.raw(key))
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.changed[key] = value
+        self.deleted.discard(key)
+        self.touched.add(key)
+        self._cache.pop(key, None)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.changed.pop(key, None)
+        self._cache.pop(key, None)
+        self.touched.add(key)
+        if key in self.spans:
+            self.deleted.add(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.changed or (key in self.spans and key not in self.deleted)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self.spans:
+            if key not in self.deleted:
+                yield key
+        for key in self.changed:
+            if key not in self.spans:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self.spans) - len(self.deleted) + sum(1 for key in self.changed if key not in self.spans)
+
+class LazyJSONStorage(JSONStorage):
+    """JSON storage decoding its top-level keys on demand
+
+    On first open, an index of top-level key -> byte span is built and saved to
+    `<name>.index`, then reused as long as the file doesn't change. The file is
+    memory-mapped and values are decoded when accessed, with a LRU cache of
+    `cache_size` decoded values. Saving copies the bytes of unchanged values
+    instead of encoding them again, in a worker thread.
+
+    Only the compact `json` codec is supported, and `write_behind` is not.
+    """
+    supports_multiprocess = False
+
+    def __init__(self, storage_name: str, *, cache_size: int = 1024, **kwargs):
+        if kwargs.get('codec', 'json') != 'json':
+            raise ValueError("Lazy loading needs the compact json codec")
+        if kwargs.get('write_behind'):
+            raise ValueError("Lazy loading doesn't support write-behind")
+
+        self.cache_size = cache_size
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        super().__init__(storage_name, **kwargs)
+
+    @property
+    def index_path(self) -> Path:
+        return self.file_path.with_suffix('.index')
+
+    def _index_signature(self) -> List[int]:
+        stat = self.file_path.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _read_index(self) -> Optional[Dict[str, Tuple[int, int]]]:
+        """Saved index, if it still matches the file"""
+        try:
+            index = CODECS['pickle'].loads(self.index_path.read_bytes())
+        except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+            return None
+
+        if index.get('signature') != self._index_signature():
+            return None
+        return index['spans']
+
+    def _write_index(self, spans: Dict[str, Tuple[int, int]]) -> None:
+        try:
+            payload = CODECS['pickle'].dumps({'signature': self._index_signature(), 'spans': spans})
+            self.index_path.write_bytes(payload)
+        except OSError as error:
+            self.logger.error(f"Error saving index: {error}")
+
+    def _map_file(self) -> mmap.mmap:
+        self._unmap_file()
+        self._file = open(self.file_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _unmap_file(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _load_data(self) -> None:
+        """Map the file and load or build its index"""
+        try:
+            buffer = self._map_file()
+            spans = self._read_index()
+            if spans is None:
+                spans = index_json_object(buffer[:])
+                self._write_index(spans)
+                self.logger.info(f"Indexed {len(spans)} keys of {self.file_path}")
+            self._data = _LazyData(buffer, spans, self.cache_size)
+        except (ValueError, UnicodeDecodeError):
+            self.logger.error(f"Corrupted storage file: {self.file_path}")
+            self._unmap_file()
+            self._create_backup()
+            self._write_index(self._write_entries(b'', []))
+            self._data = _LazyData(self._map_file(), {}, self.cache_size)
+        except Exception as error:
+            self.logger.error(f"Error loading data: {error}")
+            self._data = {}
+
+    def _write_entries(
+        self,
+        buffer: Union[bytes, mmap.mmap],
+        entries: List[Tuple[str, Optional[Tuple[int, int]], Any]]
+    ) -> Dict[str, Tuple[int, int]]:
+        """Rewrite the file, copying the bytes of unchanged values, and return its index"""
+        tmp_path = self.file_path.with_name(f'{self.file_path.name}.tmp')
+        spans: Dict[str, Tuple[int, int]] = {}
+
+        chunks = [b'{']
+        offset = 1
+        for position, (key, span, value) in enumerate(entries):
+            if span is not None:
+                raw = buffer[span[0]:span[1]]
+            else:
+                raw = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+            prefix = (b',' if position else b'') + encode_basestring(key).encode('utf-8') + b':'
+            offset += len(prefix)
+            spans[key] = (offset, offset + len(raw))
+            offset += len(raw)
+            chunks.append(prefix)
+            chunks.append(raw)
+        chunks.append(b'}')
+
+        with open(tmp_path, 'wb') as file:
+            file.write(b''.join(chunks))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.file_path)
+        return spans
+
+    def _persist(self, keys: Optional[Iterable[str]] = None) -> None:
+        """The file is rewritten by `flush` before the lock is released"""
+        self._dirty = True
+
+    async def _sync(self) -> None:
+        if self._dirty:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Rewrite and index the file in a worker thread, then map it again"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            data = self._data
+            if isinstance(data, _LazyData):
+                buffer, entries = data.buffer, data.entries()
+            else:
+                buffer, entries = b'', [(key, None, value) for key, value in data.items()]
+            self._dirty = False
+
+            def write() -> Dict[str, Tuple[int, int]]:
+                spans = self._write_entries(buffer, entries)
+                self._write_index(spans)
+                return spans
+
+            try:
+                spans = await asyncio.to_thread(write)
+            except Exception as error:
+                self._dirty = True
+                self.logger.error(f"Error saving data: {error}")
+                return
+
+            lazy_data = _LazyData(self._map_file(), spans, self.cache_size)
+            if data is not self._data:
+                # Replaced while writing, by clear or restore_backup, and saved again next
+                return
+
+            if isinstance(data, _LazyData):
+                lazy_data._cache = data._cache
+                for key, value in data.changed.items():
+                    lazy_data._cache[key] = value
+                while len(lazy_data._cache) > self.cache_size:
+                    lazy_data._cache.popitem(last=False)
+                # Changes made while the file was written
+                for key in data.touched:
+                    if key in data:
+                        lazy_data[key] = data[key]
+                    elif key in lazy_data:
+                        del lazy_data[key]
+            self._data = lazy_data
+
+    async def iter_items(self, batch_size: int = 100) -> AsyncIterator[Tuple[str, Any]]:
+        """Stream the stored items, yielding to the event loop every `batch_size` items"""
+        for position, key in enumerate(list(self._data)):
+            if position and not position % batch_size:
+                await asyncio.sleep(0)
+            try:
+                yield key, self._data[key]
+            except KeyError:
+                # Deleted while streaming
+                continue
+
+    async def close(self) -> None:
+        await super().close()
+        self._unmap_file()
+
+class LazyGuildStorage(GuildStorage, LazyJSONStorage):
+    """Guild-specific data decoded guild by guild on demand"""
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a storage file to another codec.")
+    parser.add_argument('source', type=Path, help="Storage file to convert")
+    parser.add_argument('--codec', choices=list(CODECS), required=True, help="Target codec")
+    parser.add_argument('--output', type=Path, help="Destination file (next to the source by default)")
+    args = parser.parse_args()
+
+    print(convert_storage_file(args.source, args.codec, args.output))
@@ -3,7 +3,7 @@ from datetime import timedelta
 import math
 import re
 from typing import Dict, List, Optional
-import pytz
+from zoneinfo import ZoneInfo
 from discord.ext import commands
 
 from .chat_formatting import humanize_timedelta
@@ -30,7 +30,7 @@ class TimeUtils:
         """
         Returns the current date and time in the timezone of Paris in Europe.
         """
-        return datetime.datetime.now(pytz.timezone('Europe/Paris'))
+        return datetime.datetime.now(ZoneInfo('Europe/Paris'))
     
     @classmethod
     def get_next_alarm_timestamp(cls, hours: int, minutes: int) -> int: